@@ -9,6 +9,7 @@ from starlette.status import HTTP_500_INTERNAL_SERVER_ERROR
 import endpoints
 from config import settings
 from config.di import get_di_container
+from config.i18n import registry as translation_registry
 from utils.app import FastAPI
 from utils.exceptions import (
     CustomException,
@@ -17,7 +18,11 @@ from utils.exceptions import (
     request_validation_exception_handler,
 )
 from utils.logging import get_config
-from utils.middleware import LoggingMiddleware, TranslationMiddleware
+from utils.middleware import (
+    LoggingMiddleware,
+    RequestIdMiddleware,
+    TranslationMiddleware,
+)
 from utils.pagination import add_pagination
 
 container = get_di_container()
@@ -26,6 +31,7 @@ container = get_di_container()
 logging.config.dictConfig(  # type: ignore[attr-defined]
     get_config(settings.LOGGING_PATH)
 )
+translation_registry.preload()
 
 
 __app = FastAPI(
@@ -66,6 +72,10 @@ async def logging_middleware(request: Request, call_next):
     return await LoggingMiddleware()(request, call_next)
 
 
+# outermost, so the request id is set for everything below it
+__app.add_middleware(RequestIdMiddleware)
+
+
 # custom exception handlers do not work w/o this
 # because of versioned fastapi
 for sub_app in __app.routes:
@@ -1,44 +1,542 @@
 import asyncio
+import itertools
 import logging
-from contextlib import asynccontextmanager
-from typing import AsyncIterator
+import math
+import random
+import re
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar, Token
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
 
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import event, make_url, text
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import (
+    AsyncConnection,
+    AsyncEngine,
     AsyncSession,
     async_scoped_session,
     async_sessionmaker,
     create_async_engine,
 )
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from utils.logging import get_request_id
+from utils.metrics import metrics
 
 logger = logging.getLogger("orm")
+slow_query_logger = logging.getLogger("slow_queries")
+
+T = TypeVar("T")
+
+# serialization_failure, deadlock_detected
+RETRYABLE_SQLSTATES = frozenset({"40001", "40P01"})
+
+# max statements remembered for EXPLAIN throttling
+EXPLAIN_CACHE_SIZE = 1000
+# row locks must not be taken again by EXPLAIN ANALYZE on another connection
+LOCKING_CLAUSE = re.compile(
+    r"\bFOR\s+(NO\s+KEY\s+UPDATE|UPDATE|KEY\s+SHARE|SHARE)\b", re.I
+)
+# session-level advisory locks survive the rollback of the EXPLAIN transaction
+ADVISORY_LOCK = re.compile(r"\bpg_(try_)?advisory_\w*lock", re.I)
+# read_only_sql_transaction
+READ_ONLY_SQLSTATE = "25006"
+
+_query_stats: ContextVar["QueryStats | None"] = ContextVar("query_stats", default=None)
+
+# statement_timeout, lock_timeout declared on the current route
+_timeouts: ContextVar[Tuple[float | None, float | None]] = ContextVar(
+    "db_timeouts", default=(None, None)
+)
+
+pool_checkout_wait = metrics.histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled connection.",
+)
+pool_checkout_timeouts = metrics.counter(
+    "db_pool_checkout_timeouts_total",
+    "Connection checkouts that hit the pool timeout.",
+)
+pool_checked_out = metrics.gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool."
+)
+pool_overflow = metrics.gauge(
+    "db_pool_overflow", "Connections currently open above the pool size."
+)
+transaction_retries = metrics.counter(
+    "db_transaction_retries_total",
+    "Transactions retried after a retryable error, by SQLSTATE.",
+)
+transaction_retries_exhausted = metrics.counter(
+    "db_transaction_retries_exhausted_total",
+    "Transactions that failed after using up all attempts, by SQLSTATE.",
+)
+pool_connection_lifetime = metrics.histogram(
+    "db_pool_connection_lifetime_seconds",
+    "Lifetime of closed pooled connections.",
+    buckets=(1, 10, 60, 300, 900, 1800, 3600, 7200, 86400),
+)
 
 
 class Base(DeclarativeBase):
     pass
 
 
+def activate_timeouts(
+    statement_timeout: float | None, lock_timeout: float | None
+) -> Token[Tuple[float | None, float | None]]:
+    """
+    Таймауты по умолчанию для сессий, открытых в текущем контексте
+    """
+    return _timeouts.set((statement_timeout, lock_timeout))
+
+
+def deactivate_timeouts(token: Token[Tuple[float | None, float | None]]) -> None:
+    _timeouts.reset(token)
+
+
+def get_sqlstate(exc: BaseException) -> str | None:
+    if not isinstance(exc, DBAPIError):
+        return None
+    # asyncpg exposes sqlstate, psycopg2 - pgcode
+    return getattr(exc.orig, "sqlstate", None) or getattr(exc.orig, "pgcode", None)
+
+
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() "
+    "THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """
+    Пул соединений, который замеряет время ожидания соединения
+    и считает таймауты получения соединения
+    """
+
+    metrics_name = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_checkout_timeouts.inc(pool=self.metrics_name)
+            raise
+        finally:
+            pool_checkout_wait.observe(
+                time.perf_counter() - start, pool=self.metrics_name
+            )
+
+
+def _instrument_pool(engine: AsyncEngine, name: str) -> None:
+    pool = engine.sync_engine.pool
+    pool.metrics_name = name  # type: ignore[attr-defined]
+
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        pool_checked_out.set_function(pool.checkedout, pool=name)
+        pool_overflow.set_function(lambda: max(pool.overflow(), 0), pool=name)
+
+    @event.listens_for(pool, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        connection_record.info["connected_at"] = time.monotonic()
+
+    @event.listens_for(pool, "close")
+    def _on_close(dbapi_connection, connection_record):
+        connected_at = connection_record.info.pop("connected_at", None)
+        if connected_at is not None:
+            pool_connection_lifetime.observe(time.monotonic() - connected_at, pool=name)
+
+
+class QueryStats:
+    """
+    Число запросов и суммарное время БД в рамках запроса к API.
+    При repeat_threshold предупреждает, если один и тот же запрос
+    (SQL с плейсхолдерами) повторяется больше repeat_threshold раз - признак N+1
+    """
+
+    def __init__(self, repeat_threshold: int | None = None) -> None:
+        self.repeat_threshold = repeat_threshold
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Dict[str, int] = {}
+
+    def record(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        repeats = self.statements[statement] = self.statements.get(statement, 0) + 1
+        if self.repeat_threshold and repeats == self.repeat_threshold + 1:
+            logger.warning(
+                f"Possible N+1 - statement repeated more than "
+                f"{self.repeat_threshold} times in one request - {statement}",
+                extra={"statement": statement, "request_id": get_request_id()},
+            )
+
+
+@contextmanager
+def collect_query_stats(repeat_threshold: int | None = None) -> Iterator[QueryStats]:
+    stats = QueryStats(repeat_threshold)
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+
+class QueryInstrumentation:
+    """
+    Замеряет время каждого запроса через события курсора
+    и учитывает его в QueryStats текущего запроса к API.
+    Запросы дольше slow_threshold пишутся в лог slow_queries
+    (SQL с плейсхолдерами, без значений параметров), для SELECT дольше
+    explain_threshold в фоне снимается EXPLAIN (ANALYZE, BUFFERS)
+    на отдельном соединении с таймаутом explain_timeout, не чаще раза
+    в explain_interval на запрос. EXPLAIN ANALYZE выполняется в транзакции
+    только для чтения, для SELECT ... FOR UPDATE/SHARE, advisory-блокировок
+    и запросов, которые пишут (nextval(), функции), снимается только план
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        *,
+        slow_threshold: float | None = None,
+        explain_threshold: float | None = None,
+        explain_interval: float = 300,
+        explain_timeout: float = 10,
+    ) -> None:
+        self.engine = engine
+        self.slow_threshold = slow_threshold
+        self.explain_threshold = explain_threshold
+        self.explain_interval = explain_interval
+        self.explain_timeout = explain_timeout
+        self._explained_at: Dict[str, float] = {}
+        self._explain_tasks: Set[asyncio.Task] = set()
+        event.listen(engine.sync_engine, "before_cursor_execute", self._before)
+        event.listen(engine.sync_engine, "after_cursor_execute", self._after)
+
+    # the start time lives on the execution context: after_cursor_execute
+    # is not fired for failed statements, so nothing is left behind
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        context.query_started_at = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context.query_started_at
+        self.on_query(statement, parameters, duration)
+
+    def on_query(self, statement: str, parameters: Any, duration: float) -> None:
+        stats = _query_stats.get()
+        if stats is not None:
+            stats.record(statement, duration)
+        if not self.slow_threshold or duration < self.slow_threshold:
+            return
+        slow_query_logger.warning(
+            f"Slow query ({duration * 1000:.0f} ms) - {statement}",
+            extra={
+                "statement": statement,
+                "duration": math.ceil(duration * 1000),
+                "request_id": get_request_id(),
+            },
+        )
+        if self.explain_threshold and duration >= self.explain_threshold:
+            self._schedule_explain(statement, parameters)
+
+    def _schedule_explain(self, statement: str, parameters: Any) -> None:
+        # EXPLAIN ANALYZE executes the statement, so only reads are explained
+        if not statement.lstrip().upper().startswith("SELECT"):
+            return
+        # transaction timeouts (Database._set_timeouts)
+        if "set_config(" in statement:
+            return
+        now = time.monotonic()
+        if now - self._explained_at.get(statement, -math.inf) < self.explain_interval:
+            return
+        if len(self._explained_at) > EXPLAIN_CACHE_SIZE:
+            self._explained_at.clear()
+        self._explained_at[statement] = now
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        task = loop.create_task(self._explain(statement, parameters))
+        self._explain_tasks.add(task)
+        task.add_done_callback(self._explain_tasks.discard)
+
+    async def _explain(self, statement: str, parameters: Any) -> None:
+        # the task runs in a copy of the request context
+        _query_stats.set(None)
+        analyze = not (
+            LOCKING_CLAUSE.search(statement) or ADVISORY_LOCK.search(statement)
+        )
+        try:
+            try:
+                plan = await self._run_explain(statement, parameters, analyze)
+            except DBAPIError as e:
+                if not analyze or get_sqlstate(e) != READ_ONLY_SQLSTATE:
+                    raise
+                plan = await self._run_explain(statement, parameters, False)
+        except SQLAlchemyError as e:
+            slow_query_logger.warning(
+                f"Slow query EXPLAIN failed - {str(e)}",
+                extra={"statement": statement, "request_id": get_request_id()},
+                exc_info=e,
+            )
+            return
+        slow_query_logger.warning(
+            f"Slow query plan - {statement}",
+            extra={
+                "statement": statement,
+                "plan": plan,
+                "request_id": get_request_id(),
+            },
+        )
+
+    async def _run_explain(self, statement: str, parameters: Any, analyze: bool) -> Any:
+        options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+        async with self.engine.connect() as connection:
+            if connection.dialect.name == "postgresql":
+                await connection.exec_driver_sql("SET TRANSACTION READ ONLY")
+                await connection.exec_driver_sql(
+                    f"SET LOCAL statement_timeout = "
+                    f"{int(self.explain_timeout * 1000)}"
+                )
+            result = await connection.exec_driver_sql(
+                f"EXPLAIN ({options}) {statement}", parameters
+            )
+            plan = result.scalar()
+            await connection.rollback()
+        return plan
+
+
+def _create_session_factory(
+    bind: AsyncEngine | AsyncConnection, **options: Any
+) -> async_scoped_session:
+    return async_scoped_session(
+        async_sessionmaker(
+            class_=AsyncSession,
+            autocommit=False,
+            autoflush=True,
+            bind=bind,
+            **options,
+        ),
+        scopefunc=asyncio.current_task,
+    )
+
+
+class Replica:
+    def __init__(self, engine: AsyncEngine) -> None:
+        self.engine = engine
+        self.session_factory = _create_session_factory(engine)
+        # пока отставание не измерено, реплика не используется
+        self.lag = math.inf
+        self.lag_checked_at = -math.inf
+        self.lag_check: asyncio.Task | None = None
+
+
 class Database:
-    def __init__(self, db_url: str) -> None:
-        self._engine = create_async_engine(db_url, future=True, echo=True)
-        self._session_factory = async_scoped_session(
-            async_sessionmaker(
-                class_=AsyncSession,
-                autocommit=False,
-                autoflush=True,
-                bind=self._engine,
-            ),
-            scopefunc=asyncio.current_task,
+    def __init__(
+        self,
+        db_url: str,
+        *,
+        replica_urls: Sequence[str] = (),
+        replica_max_lag: float = 5,
+        replica_lag_check_interval: float = 1,
+        replica_lag_check_timeout: float = 1,
+        echo: bool = False,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: int = -1,
+        pool_pre_ping: bool = False,
+        prepared_statement_cache_size: int = 100,
+        transaction_attempts: int = 3,
+        transaction_retry_backoff: float = 0.05,
+        transaction_retry_max_backoff: float = 1,
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
+        slow_query_threshold: float | None = None,
+        slow_query_explain_threshold: float | None = None,
+    ) -> None:
+        self._query_options = dict(
+            slow_threshold=slow_query_threshold,
+            explain_threshold=slow_query_explain_threshold,
         )
+        self._engine_options = dict(
+            echo=echo,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+        )
+        self._prepared_statement_cache_size = prepared_statement_cache_size
+        self.transaction_attempts = transaction_attempts
+        self.transaction_retry_backoff = transaction_retry_backoff
+        self.transaction_retry_max_backoff = transaction_retry_max_backoff
+        self.statement_timeout = statement_timeout
+        self.lock_timeout = lock_timeout
+        self._engine = self._create_engine(db_url, "primary")
+        self._session_factory = _create_session_factory(self._engine)
 
-    def create_database(self) -> None:
-        Base.metadata.create_all(self._engine)
+        self.replica_max_lag = replica_max_lag
+        self.replica_lag_check_interval = replica_lag_check_interval
+        self.replica_lag_check_timeout = replica_lag_check_timeout
+        self._replicas = [
+            Replica(self._create_engine(url, f"replica{index}"))
+            for index, url in enumerate(replica_urls)
+        ]
+        self._replica_cycle = itertools.cycle(self._replicas)
+
+    def _create_engine(self, db_url: str, name: str) -> AsyncEngine:
+        connect_args = {}
+        if make_url(db_url).get_driver_name() == "asyncpg":
+            connect_args["prepared_statement_cache_size"] = (
+                self._prepared_statement_cache_size
+            )
+        engine = create_async_engine(
+            db_url,
+            future=True,
+            poolclass=InstrumentedPool,
+            connect_args=connect_args,
+            **self._engine_options,
+        )
+        _instrument_pool(engine, name)
+        QueryInstrumentation(engine, **self._query_options)
+        return engine
+
+    async def _query_lag(self, replica: Replica) -> float:
+        async with replica.engine.connect() as connection:
+            return float((await connection.execute(REPLICA_LAG_QUERY)).scalar() or 0)
+
+    async def _measure_lag(self, replica: Replica) -> None:
+        try:
+            replica.lag = await asyncio.wait_for(
+                self._query_lag(replica), self.replica_lag_check_timeout
+            )
+        except (SQLAlchemyError, OSError, asyncio.TimeoutError) as e:
+            logger.warning(
+                f"Replica {replica.engine.url!r} is unavailable - {str(e)}",
+                exc_info=e,
+            )
+            replica.lag = math.inf
+        finally:
+            replica.lag_checked_at = time.monotonic()
+            replica.lag_check = None
+
+    async def _get_session_factory(self, readonly: bool) -> async_scoped_session:
+        if not readonly:
+            return self._session_factory
+        for _ in range(len(self._replicas)):
+            replica = next(self._replica_cycle)
+            # отставание обновляется в фоне, запрос использует последний замер
+            if (
+                replica.lag_check is None
+                and time.monotonic() - replica.lag_checked_at
+                > self.replica_lag_check_interval
+            ):
+                replica.lag_check = asyncio.create_task(self._measure_lag(replica))
+            if replica.lag <= self.replica_max_lag:
+                return replica.session_factory
+        return self._session_factory
+
+    async def create_database(self) -> None:
+        async with self._engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
 
     @asynccontextmanager
-    async def session(self) -> AsyncIterator[AsyncSession]:
-        session: AsyncSession = self._session_factory()
+    async def isolated(self) -> AsyncIterator[AsyncConnection]:
+        """
+        Все сессии внутри контекста (в том числе только для чтения) работают
+        в одной транзакции, которая откатывается при выходе.
+        Коммиты сессий превращаются в сохранение точек отката.
+        Используется для изоляции тестов
+        """
+        async with self._engine.connect() as connection:
+            transaction = await connection.begin()
+            session_factory, replicas = self._session_factory, self._replicas
+            self._session_factory = _create_session_factory(
+                connection, join_transaction_mode="create_savepoint"
+            )
+            self._replicas = []
+            try:
+                yield connection
+            finally:
+                self._session_factory, self._replicas = session_factory, replicas
+                await transaction.rollback()
+
+    async def _set_timeouts(
+        self,
+        session: AsyncSession,
+        statement_timeout: float | None,
+        lock_timeout: float | None,
+    ) -> None:
+        route_statement_timeout, route_lock_timeout = _timeouts.get()
+        if statement_timeout is None:
+            statement_timeout = route_statement_timeout
+        if statement_timeout is None:
+            statement_timeout = self.statement_timeout
+        if lock_timeout is None:
+            lock_timeout = route_lock_timeout
+        if lock_timeout is None:
+            lock_timeout = self.lock_timeout
+
+        timeouts = {
+            name: str(int(value * 1000))
+            for name, value in (
+                ("statement_timeout", statement_timeout),
+                ("lock_timeout", lock_timeout),
+            )
+            if value
+        }
+        if not timeouts:
+            return
+        # set_config(..., is_local => true) is SET LOCAL: it begins the
+        # transaction and is reset when the transaction ends
+        await session.execute(
+            text(
+                "SELECT "
+                + ", ".join(f"set_config('{name}', :{name}, true)" for name in timeouts)
+            ),
+            timeouts,
+        )
+
+    @asynccontextmanager
+    async def session(
+        self,
+        *,
+        readonly: bool = False,
+        new: bool = False,
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
+    ) -> AsyncIterator[AsyncSession]:
+        """
+        readonly - сессия только для чтения, распределяется между репликами,
+        отставание которых не превышает replica_max_lag секунд.
+        new - отдельная сессия вместо общей для текущей задачи.
+        statement_timeout, lock_timeout - таймауты транзакции в секундах,
+        по умолчанию берутся из роута, затем из настроек БД
+        """
+        session_factory = await self._get_session_factory(readonly)
+        session: AsyncSession = (
+            session_factory.session_factory() if new else session_factory()
+        )
         try:
+            await self._set_timeouts(session, statement_timeout, lock_timeout)
             logging.debug("YIELDING...")
             yield session
         except Exception as e:
@@ -60,6 +558,55 @@ class Database:
                     f"Session rollback because of exception on commit - {str(e)}",
                     exc_info=e,
                 )
+                raise
         finally:
             logging.debug("CLOSING... ")
             await session.close()
+            # scoped sessions are reused within a task, drop per-unit-of-work state
+            session.info.clear()
+
+    async def run_in_transaction(
+        self,
+        func: Callable[[AsyncSession], Awaitable[T]],
+        *,
+        readonly: bool = False,
+        new: bool = False,
+        attempts: int | None = None,
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
+    ) -> T:
+        """
+        Выполняет func(session) в транзакции и повторяет ее целиком при
+        ошибке сериализации (40001) или дедлоке (40P01), с экспоненциальной
+        задержкой со случайным разбросом. func должна быть безопасна
+        для повторного выполнения
+        """
+        attempts = attempts or self.transaction_attempts
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                async with self.session(
+                    readonly=readonly,
+                    new=new,
+                    statement_timeout=statement_timeout,
+                    lock_timeout=lock_timeout,
+                ) as session:
+                    return await func(session)
+            except DBAPIError as e:
+                sqlstate = get_sqlstate(e)
+                if sqlstate not in RETRYABLE_SQLSTATES:
+                    raise
+                if attempt == attempts:
+                    transaction_retries_exhausted.inc(sqlstate=sqlstate)
+                    raise
+                transaction_retries.inc(sqlstate=sqlstate)
+                delay = min(
+                    self.transaction_retry_max_backoff,
+                    self.transaction_retry_backoff * 2 ** (attempt - 1),
+                )
+                logger.warning(
+                    f"Retrying transaction after {sqlstate} "
+                    f"(attempt {attempt} of {attempts})"
+                )
+                await asyncio.sleep(random.uniform(0, delay))
@@ -1,7 +1,42 @@
-from dependency_injector import containers
+from dependency_injector import containers, providers
+
+from config import settings
+from config.db import Database
+from utils.cache import RedisCacheBackend
 
 
 class Container(containers.DeclarativeContainer):
     wiring_config = containers.WiringConfiguration(
         packages=["endpoints"], modules=["config.celery"]
     )
+
+    db = providers.Singleton(
+        Database,
+        db_url=settings.DATABASE_URL,
+        replica_urls=settings.DB_REPLICA_URLS,
+        replica_max_lag=settings.DB_REPLICA_MAX_LAG,
+        replica_lag_check_interval=settings.DB_REPLICA_LAG_CHECK_INTERVAL,
+        replica_lag_check_timeout=settings.DB_REPLICA_LAG_CHECK_TIMEOUT,
+        echo=settings.DB_ECHO,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        prepared_statement_cache_size=settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        transaction_attempts=settings.DB_TRANSACTION_ATTEMPTS,
+        transaction_retry_backoff=settings.DB_TRANSACTION_RETRY_BACKOFF,
+        transaction_retry_max_backoff=settings.DB_TRANSACTION_RETRY_MAX_BACKOFF,
+        statement_timeout=settings.DB_STATEMENT_TIMEOUT,
+        lock_timeout=settings.DB_LOCK_TIMEOUT,
+        slow_query_threshold=settings.DB_SLOW_QUERY_THRESHOLD,
+        slow_query_explain_threshold=settings.DB_SLOW_QUERY_EXPLAIN_THRESHOLD,
+    )
+
+    cache = providers.Singleton(
+        RedisCacheBackend,
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        password=settings.REDIS_PASSWORD,
+        db=settings.REDIS_CACHE_DB,
+    )
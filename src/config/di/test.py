@@ -1,8 +1,33 @@
-from dependency_injector import containers
+from dependency_injector import containers, providers
 
+from config import settings
+from config.db import Database
 from config.di.dev import Container
+from utils.cache import InMemoryCacheBackend
+from utils.tests import TemplateDatabase
 
 
 @containers.copy(Container)
 class TestContainer(containers.DeclarativeContainer):
-    pass
+    test_database = providers.Singleton(TemplateDatabase, url=settings.DATABASE_URL)
+
+    db = providers.Singleton(
+        Database,
+        db_url=test_database.provided.create.call(),
+        echo=settings.DB_ECHO,
+        pool_size=2,
+        max_overflow=0,
+        pool_timeout=5,
+        pool_recycle=-1,
+        pool_pre_ping=False,
+        prepared_statement_cache_size=settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+        transaction_attempts=settings.DB_TRANSACTION_ATTEMPTS,
+        transaction_retry_backoff=settings.DB_TRANSACTION_RETRY_BACKOFF,
+        transaction_retry_max_backoff=settings.DB_TRANSACTION_RETRY_MAX_BACKOFF,
+        statement_timeout=settings.DB_STATEMENT_TIMEOUT,
+        lock_timeout=settings.DB_LOCK_TIMEOUT,
+        slow_query_threshold=settings.DB_SLOW_QUERY_THRESHOLD,
+        slow_query_explain_threshold=settings.DB_SLOW_QUERY_EXPLAIN_THRESHOLD,
+    )
+
+    cache = providers.Singleton(InMemoryCacheBackend)
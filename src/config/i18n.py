@@ -1,20 +1,320 @@
+import functools
 import gettext
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import threading
+from contextvars import ContextVar, Token
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+from fastapi.encoders import ENCODERS_BY_TYPE
 
 DEFAULT_LANGUAGE = "en"
 SUPPORTED_LANGUAGES = ["en", "ru"]
 DOMAIN = "base"
 LOCALE_DIR = "locale"
-_lang = DEFAULT_LANGUAGE
+NEGOTIATION_CACHE_SIZE = 1024
+_lang: ContextVar[str] = ContextVar("lang", default=DEFAULT_LANGUAGE)
+
+BUNDLE_SUFFIX = ".bundle"
+BUNDLE_MAGIC = b"I18B"
+BUNDLE_VERSION = 2
+_BUNDLE_HEADER = struct.Struct("<4sII")
+_BUNDLE_ENTRY = struct.Struct("<QIIII")
+_BUNDLE_HASH = struct.Struct("<Q")
+
+logger = logging.getLogger("i18n")
+
+
+def _bundle_hash(key: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def _is_outdated(bundle: str, mofile: str) -> bool:
+    if not os.path.exists(mofile):
+        return False
+    return os.path.getmtime(mofile) > os.path.getmtime(bundle)
+
+
+class MappedTranslations(gettext.NullTranslations):
+    """
+    Каталог переводов, собранный `utils/pygettext.py --compile`.
+    Файл отображается в память через mmap, поэтому все воркеры на хосте
+    разделяют одни и те же страницы page cache.
+    Отображение закрывается сборщиком мусора, когда на каталог
+    больше никто не ссылается
+    """
+
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        with open(path, "rb") as fp:
+            # ValueError for an empty file
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, count = _BUNDLE_HEADER.unpack_from(self._map, 0)
+            if magic != BUNDLE_MAGIC or version != BUNDLE_VERSION:
+                raise OSError(f"Unsupported translation bundle - {path}")
+            if _BUNDLE_HEADER.size + count * _BUNDLE_ENTRY.size > len(self._map):
+                raise OSError(f"Truncated translation bundle - {path}")
+            self._count = count
+            self.plural = self._plural_forms()
+        except (OSError, ValueError, struct.error):
+            self._map.close()
+            raise
+
+    def _plural_forms(self) -> Callable[[int], int]:
+        # same parsing of the metadata entry as in gettext.GNUTranslations
+        metadata = self._lookup(b"")
+        for line in metadata.decode("utf-8").splitlines() if metadata else ():
+            key, _sep, value = line.partition(":")
+            if key.strip().lower() == "plural-forms":
+                return gettext.c2py(value.split(";")[1].split("plural=")[1])
+        return lambda n: int(n != 1)
+
+    def _lookup(self, key: bytes) -> bytes | None:
+        keyhash = _bundle_hash(key)
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            offset = _BUNDLE_HEADER.size + middle * _BUNDLE_ENTRY.size
+            if _BUNDLE_HASH.unpack_from(self._map, offset)[0] < keyhash:
+                low = middle + 1
+            else:
+                high = middle
+        # entries with colliding hashes are stored next to each other
+        for position in range(low, self._count):
+            offset = _BUNDLE_HEADER.size + position * _BUNDLE_ENTRY.size
+            entry_hash, key_offset, key_size, value_offset, value_size = (
+                _BUNDLE_ENTRY.unpack_from(self._map, offset)
+            )
+            if entry_hash != keyhash:
+                break
+            key_end = key_offset + key_size
+            value_end = value_offset + value_size
+            if self._map[key_offset:key_end] == key:
+                return self._map[value_offset:value_end]
+        return None
+
+    def gettext(self, message: str) -> str:
+        value = self._lookup(message.encode("utf-8"))
+        if value is None:
+            return super().gettext(message)
+        return value.decode("utf-8")
+
+    def ngettext(self, msgid1: str, msgid2: str, n: int) -> str:
+        key = f"{msgid1}\0{self.plural(n)}".encode("utf-8")
+        value = self._lookup(key)
+        if value is None:
+            return super().ngettext(msgid1, msgid2, n)
+        return value.decode("utf-8")
+
+    def pgettext(self, context: str, message: str) -> str:
+        value = self._lookup(f"{context}\x04{message}".encode("utf-8"))
+        if value is None:
+            return super().pgettext(context, message)
+        return value.decode("utf-8")
+
+    def npgettext(self, context: str, msgid1: str, msgid2: str, n: int) -> str:
+        key = f"{context}\x04{msgid1}\0{self.plural(n)}".encode("utf-8")
+        value = self._lookup(key)
+        if value is None:
+            return super().npgettext(context, msgid1, msgid2, n)
+        return value.decode("utf-8")
+
+    def close(self) -> None:
+        self._map.close()
+
+
+class TranslationRegistry:
+    """
+    Хранит загруженные каталоги переводов в памяти процесса,
+    чтобы не обращаться к файловой системе на каждый вызов `_`
+    """
+
+    def __init__(self, domain: str, localedir: str, languages: Iterable[str]) -> None:
+        self.domain = domain
+        self.localedir = localedir
+        self.languages = tuple(languages)
+        self.hits = 0
+        self.misses = 0
+        # растет на каждый reload, сбрасывает переводы LazyString
+        self.generation = 0
+        self._catalogs: Dict[str, gettext.NullTranslations] = {}
+        self._lock = threading.Lock()
+
+    def get(self, lang: str) -> gettext.NullTranslations:
+        catalog = self._catalogs.get(lang)
+        if catalog is not None:
+            self.hits += 1
+            return catalog
+        with self._lock:
+            catalog = self._catalogs.get(lang)
+            if catalog is None:
+                self.misses += 1
+                catalog = self._load(lang)
+                self._catalogs[lang] = catalog
+        return catalog
+
+    def preload(self) -> None:
+        for lang in self.languages:
+            self.get(lang)
+
+    def reload(self) -> None:
+        # старые каталоги не закрываются явно: их еще могут читать
+        # обработчики в пуле потоков
+        with self._lock:
+            self._catalogs = {}
+            self.generation += 1
+        self.preload()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "loaded": len(self._catalogs),
+        }
+
+    def _load(self, lang: str) -> gettext.NullTranslations:
+        base = os.path.join(self.localedir, lang, "LC_MESSAGES", self.domain)
+        bundle = base + BUNDLE_SUFFIX
+        if os.path.exists(bundle):
+            if _is_outdated(bundle, base + ".mo"):
+                logger.warning(f"Translation bundle is older than catalog - {bundle}")
+            else:
+                try:
+                    return MappedTranslations(bundle)
+                except (OSError, ValueError, struct.error) as e:
+                    logger.warning(
+                        f"Translation bundle for {lang} is not available - {str(e)}"
+                    )
+        # gettext.translation кэширует каталоги на уровне модуля,
+        # поэтому после reload файл читается заново
+        try:
+            with open(base + ".mo", "rb") as fp:
+                return gettext.GNUTranslations(fp)
+        except OSError as e:
+            logger.warning(
+                f"Translation catalog for {lang} is not available - {str(e)}"
+            )
+            return gettext.NullTranslations()
+
+
+registry = TranslationRegistry(DOMAIN, LOCALE_DIR, SUPPORTED_LANGUAGES)
 
 
-def activate_translation(lang: str):
-    global _lang
-    _lang = DEFAULT_LANGUAGE if lang not in SUPPORTED_LANGUAGES else lang
+def _parse_accept_language(header: str) -> List[Tuple[str, float]]:
+    languages = []
+    for position, item in enumerate(header.split(",")):
+        lang, _sep, params = item.strip().partition(";")
+        lang = lang.strip().lower().replace("_", "-")
+        if not lang:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            key, _sep, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            languages.append((lang, quality, position))
+    languages.sort(key=lambda item: (-item[1], item[2]))
+    return [(lang, quality) for lang, quality, _position in languages]
+
+
+@functools.lru_cache(maxsize=NEGOTIATION_CACHE_SIZE)
+def negotiate_language(header: str | None) -> str:
+    """
+    Выбирает язык из заголовка Accept-Language с учетом q-значений
+    и отката региональных вариантов (ru-RU -> ru)
+    """
+    if not header:
+        return DEFAULT_LANGUAGE
+    for lang, _quality in _parse_accept_language(header):
+        if lang in SUPPORTED_LANGUAGES:
+            return lang
+        primary = lang.split("-", 1)[0]
+        if primary in SUPPORTED_LANGUAGES:
+            return primary
+    return DEFAULT_LANGUAGE
+
+
+def get_language() -> str:
+    return _lang.get()
+
+
+def activate_translation(lang: str | None) -> Token[str]:
+    return _lang.set(DEFAULT_LANGUAGE if lang not in SUPPORTED_LANGUAGES else lang)
+
+
+def deactivate_translation(token: Token[str]) -> None:
+    _lang.reset(token)
 
 
 def _(message: str) -> str:
-    if _lang == DEFAULT_LANGUAGE:
+    lang = _lang.get()
+    if lang == DEFAULT_LANGUAGE:
+        return message
+    return registry.get(lang).gettext(message)
+
+
+class LazyString:
+    """
+    Строка, перевод которой откладывается до сериализации ответа.
+    Результат перевода кэшируется отдельно для каждого языка
+    до перезагрузки каталогов (registry.reload)
+    """
+
+    __slots__ = ("message", "_translated")
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+        self._translated: Dict[str, Tuple[int, str]] = {}
+
+    def __str__(self) -> str:
+        lang = _lang.get()
+        generation = registry.generation
+        cached = self._translated.get(lang)
+        if cached is None or cached[0] != generation:
+            cached = self._translated[lang] = (generation, _(self.message))
+        return cached[1]
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.message!r})"
+
+    # only against other LazyString: the translation depends on the language,
+    # the hash of an object must not
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, LazyString):
+            return self.message == other.message
+        return NotImplemented
+
+    def __hash__(self) -> int:
+        return hash(self.message)
+
+    def __len__(self) -> int:
+        return len(str(self))
+
+    def __add__(self, other: str) -> str:
+        return str(self) + other
+
+    def __radd__(self, other: str) -> str:
+        return other + str(self)
+
+    def __mod__(self, other: Any) -> str:
+        return str(self) % other
+
+    def format(self, *args: Any, **kwargs: Any) -> str:
+        return str(self).format(*args, **kwargs)
+
+
+def gettext_lazy(message: str | LazyString) -> LazyString:
+    if isinstance(message, LazyString):
         return message
-    return gettext.translation(DOMAIN, localedir=LOCALE_DIR, languages=[_lang]).gettext(
-        message
-    )
+    return LazyString(message)
+
+
+ENCODERS_BY_TYPE[LazyString] = str
@@ -6,6 +6,48 @@ DB_NAME: str = os.environ.get("DB_NAME", "")
 DB_HOST: str = os.environ.get("DB_HOST", "")
 DB_PORT: str = os.environ.get("DB_PORT", "")
 DATABASE_URL: str = os.environ.get("DATABASE_URL", "")
+DB_REPLICA_URLS = [
+    url for url in os.environ.get("DB_REPLICA_URLS", "").split(",") if url
+]
+DB_REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", 5))
+DB_REPLICA_LAG_CHECK_INTERVAL = float(
+    os.environ.get("DB_REPLICA_LAG_CHECK_INTERVAL", 1)
+)
+DB_REPLICA_LAG_CHECK_TIMEOUT = float(os.environ.get("DB_REPLICA_LAG_CHECK_TIMEOUT", 1))
+DB_ECHO = bool(int(os.environ.get("DB_ECHO", 0)))
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = bool(int(os.environ.get("DB_POOL_PRE_PING", 1)))
+DB_PREPARED_STATEMENT_CACHE_SIZE = int(
+    os.environ.get("DB_PREPARED_STATEMENT_CACHE_SIZE", 100)
+)
+DB_STATEMENT_TIMEOUT = float(os.environ.get("DB_STATEMENT_TIMEOUT", 0)) or None
+DB_LOCK_TIMEOUT = float(os.environ.get("DB_LOCK_TIMEOUT", 0)) or None
+DB_SLOW_QUERY_THRESHOLD = float(os.environ.get("DB_SLOW_QUERY_THRESHOLD", 0.5)) or None
+DB_SLOW_QUERY_EXPLAIN_THRESHOLD = (
+    float(os.environ.get("DB_SLOW_QUERY_EXPLAIN_THRESHOLD", 0)) or None
+)
+DB_N_PLUS_ONE_THRESHOLD = int(os.environ.get("DB_N_PLUS_ONE_THRESHOLD", 10))
+DB_TRANSACTION_ATTEMPTS = int(os.environ.get("DB_TRANSACTION_ATTEMPTS", 3))
+DB_TRANSACTION_RETRY_BACKOFF = float(
+    os.environ.get("DB_TRANSACTION_RETRY_BACKOFF", 0.05)
+)
+DB_TRANSACTION_RETRY_MAX_BACKOFF = float(
+    os.environ.get("DB_TRANSACTION_RETRY_MAX_BACKOFF", 1)
+)
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.environ.get("REDIS_PORT", 6379))
+REDIS_PASSWORD = os.environ.get("REDIS_PASSWORD", "")
+REDIS_CACHE_DB = int(os.environ.get("REDIS_CACHE_DB", 0))
+ENTITY_CACHE_TTL = int(os.environ.get("ENTITY_CACHE_TTL", 300))
+ENTITY_CACHE_NEGATIVE_TTL = int(os.environ.get("ENTITY_CACHE_NEGATIVE_TTL", 30))
+
+PAGINATION_COUNT_CACHE_TTL = int(os.environ.get("PAGINATION_COUNT_CACHE_TTL", 60))
+
+SECRET_KEY = os.environ.get("SECRET_KEY", "")
 
 TIMEZONE = os.environ.get("TIMEZONE")
 
@@ -0,0 +1,25 @@
+from typing import AsyncIterator, Iterator
+
+import pytest
+import pytest_asyncio
+
+from config.db import Database
+from config.di import Container, TestContainer
+
+
+# async fixtures share the session event loop
+# (asyncio_default_fixture_loop_scope in pyproject.toml),
+# tests opt in with pytest.mark.asyncio(loop_scope="session")
+@pytest.fixture(scope="session")
+def database() -> Iterator[Database]:
+    with Container.db.override(TestContainer.db), Container.cache.override(
+        TestContainer.cache
+    ):
+        yield Container.db()
+    TestContainer.test_database().drop()
+
+
+@pytest_asyncio.fixture
+async def db(database: Database) -> AsyncIterator[Database]:
+    async with database.isolated():
+        yield database
@@ -2,6 +2,8 @@ from typing import Tuple
 
 from utils.routing import APIRouter
 
+from . import metrics
+
 
 def get_routers() -> Tuple[APIRouter]:
-    return tuple()  # type: ignore[return-value]
+    return (metrics.router,)
@@ -0,0 +1,11 @@
+from fastapi.responses import PlainTextResponse
+
+from utils.metrics import metrics
+from utils.routing import APIRouter
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics() -> str:
+    return metrics.render()
@@ -78,6 +78,19 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
+    # connection can be shared by programmatic callers (see utils.tests)
+    connection = config.attributes.get("connection", None)
+    if connection is not None:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_object=include_object,
+        )
+
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
@@ -0,0 +1,28 @@
+from typing import AsyncIterator
+
+import pytest_asyncio
+
+from config.db import Database
+from tests.models import SmokeItem
+from utils.repo import Repo
+
+
+@pytest_asyncio.fixture
+async def items(db: Database) -> Repo[SmokeItem]:
+    # the table lives in the test transaction and is rolled back with it
+    async with db.session() as session:
+        connection = await session.connection()
+        await connection.run_sync(SmokeItem.__table__.create)
+    return Repo(db, SmokeItem, "id")
+
+
+@pytest_asyncio.fixture
+async def committed_items(database: Database) -> AsyncIterator[Repo[SmokeItem]]:
+    # sessions run their own transactions, for tests of commit and rollback
+    async with database.session(new=True) as session:
+        connection = await session.connection()
+        await connection.run_sync(SmokeItem.__table__.create)
+    yield Repo(database, SmokeItem, "id")
+    async with database.session(new=True) as session:
+        connection = await session.connection()
+        await connection.run_sync(SmokeItem.__table__.drop)
@@ -0,0 +1,18 @@
+from pydantic import BaseModel
+from sqlalchemy import String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from config.db import Base
+
+
+class SmokeItem(Base):
+    __tablename__ = "smoke_items"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(50), unique=True)
+    age: Mapped[int] = mapped_column(default=0)
+
+
+class SmokeItemIn(BaseModel):
+    name: str
+    age: int = 0
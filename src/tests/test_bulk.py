@@ -0,0 +1,73 @@
+import pytest
+from sqlalchemy import func, select
+
+from config.db import Database
+from tests.models import SmokeItem, SmokeItemIn
+from utils.repo import Repo
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+async def test_create_many_returns_rows_in_order(
+    db: Database, items: Repo[SmokeItem]
+) -> None:
+    async with db.session() as session:
+        created = await items.create_many(
+            [SmokeItemIn(name=name, age=age) for age, name in enumerate("cab")],
+            session=session,
+        )
+        assert [(item.name, item.age) for item in created] == [
+            ("c", 0),
+            ("a", 1),
+            ("b", 2),
+        ]
+        assert await items.create_many([], session=session) == []
+
+
+async def test_upsert_many_updates_conflicting_rows(
+    db: Database, items: Repo[SmokeItem]
+) -> None:
+    async with db.session() as session:
+        (first,) = await items.create_many(
+            [SmokeItemIn(name="a", age=1)], session=session
+        )
+        rows = await items.upsert_many(
+            [SmokeItemIn(name="a", age=2), SmokeItemIn(name="b", age=3)],
+            conflict_cols=["name"],
+            session=session,
+        )
+        assert rows[0] is first
+        assert [(row.name, row.age) for row in rows] == [("a", 2), ("b", 3)]
+
+
+async def test_upsert_many_without_update_cols_skips_conflicts(
+    db: Database, items: Repo[SmokeItem]
+) -> None:
+    async with db.session() as session:
+        await items.create_many([SmokeItemIn(name="a", age=1)], session=session)
+        rows = await items.upsert_many(
+            [SmokeItemIn(name="a", age=2), SmokeItemIn(name="b", age=3)],
+            conflict_cols=["name"],
+            update_cols=[],
+            session=session,
+        )
+        assert [row.name for row in rows] == ["b"]
+
+
+async def test_copy_many_inserts_rows(db: Database, items: Repo[SmokeItem]) -> None:
+    async with db.session() as session:
+        entries = [SmokeItemIn(name=str(i), age=i) for i in range(100)]
+        assert await items.copy_many(entries, session=session) == 100
+        assert await session.scalar(select(func.sum(SmokeItem.age))) == 4950
+
+
+async def test_copy_many_is_rolled_back_with_the_session(
+    database: Database, committed_items: Repo[SmokeItem]
+) -> None:
+    with pytest.raises(ValueError):
+        async with database.session(new=True) as session:
+            # COPY is the first statement of the transaction
+            await committed_items.copy_many([SmokeItemIn(name="a")], session=session)
+            raise ValueError
+    async with database.session(new=True) as session:
+        assert await session.scalar(select(func.count()).select_from(SmokeItem)) == 0
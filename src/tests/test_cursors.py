@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import JSON, Column
+
+from config import settings
+from tests.models import SmokeItem
+from utils.exceptions import Custom400Exception
+from utils.pagination import column_adapter, decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip() -> None:
+    columns = [SmokeItem.age, SmokeItem.id]
+    assert decode_cursor(encode_cursor(columns, [1, 2]), columns) == [1, 2]
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        "",
+        "garbage",
+        "e30.AAAA",
+        # signed for ordering by id only
+        encode_cursor([SmokeItem.id], [2]),
+    ],
+)
+def test_invalid_cursors_are_rejected(cursor: str) -> None:
+    with pytest.raises(Custom400Exception):
+        decode_cursor(cursor, [SmokeItem.age, SmokeItem.id])
+
+
+def test_tampered_cursor_is_rejected() -> None:
+    columns = [SmokeItem.id]
+    _payload, signature = encode_cursor(columns, [2]).split(".")
+    forged = encode_cursor(columns, [3]).split(".")[0]
+    with pytest.raises(Custom400Exception):
+        decode_cursor(f"{forged}.{signature}", columns)
+
+
+def test_cursors_require_secret_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "SECRET_KEY", "")
+    with pytest.raises(RuntimeError):
+        encode_cursor([SmokeItem.id], [1])
+
+
+def test_columns_without_python_type() -> None:
+    column = Column("data", JSON)
+    assert decode_cursor(encode_cursor([column], [{"a": 1}]), [column]) == [{"a": 1}]
+    assert column_adapter(column).validate_python([1]) == [1]
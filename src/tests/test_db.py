@@ -0,0 +1,157 @@
+import asyncio
+from typing import List
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from config.db import Database, activate_timeouts, deactivate_timeouts, get_sqlstate
+from config.di import TestContainer
+from tests.models import SmokeItem, SmokeItemIn
+from utils import decorators
+from utils.app import FastAPI
+from utils.repo import Repo
+from utils.routing import APIRouter
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+SERIALIZATION_FAILURE = text(
+    "DO $$ BEGIN RAISE EXCEPTION USING ERRCODE = 'serialization_failure'; END $$"
+)
+SHOW_TIMEOUTS = text(
+    "SELECT current_setting('statement_timeout'), current_setting('lock_timeout')"
+)
+
+
+async def test_worker_database_is_cloned_from_template(db: Database) -> None:
+    test_database = TestContainer.test_database()
+    async with db.session() as session:
+        assert await session.scalar(text("SELECT current_database()")) == (
+            test_database.worker_name
+        )
+        assert await session.scalar(
+            text("SELECT count(*) FROM pg_database WHERE datname = :name"),
+            {"name": test_database.template_name},
+        )
+        assert await session.scalar(text("SELECT version_num FROM alembic_version"))
+
+
+async def test_isolated_rolls_back_commits(database: Database) -> None:
+    async with database.isolated():
+        async with database.session() as session:
+            await session.execute(text("CREATE TABLE isolation_check (id int)"))
+            await session.execute(text("INSERT INTO isolation_check VALUES (1)"))
+        async with database.session(new=True) as session:
+            assert await session.scalar(text("SELECT count(*) FROM isolation_check"))
+
+    async with database.session() as session:
+        assert (
+            await session.scalar(text("SELECT to_regclass('isolation_check')")) is None
+        )
+
+
+async def test_nested_calls_join_the_outer_session(db: Database) -> None:
+    @decorators.session
+    async def inner(*, session):
+        return session
+
+    @decorators.session
+    async def outer(*, session):
+        return session, await inner()
+
+    outer_session, inner_session = await outer()
+    assert outer_session is inner_session
+
+
+async def test_child_tasks_open_their_own_session(db: Database) -> None:
+    @decorators.session
+    async def inner(*, session):
+        return session
+
+    @decorators.session
+    async def outer(*, session):
+        # an AsyncSession can't be shared by concurrent tasks
+        return session, await asyncio.create_task(inner())
+
+    outer_session, inner_session = await outer()
+    assert outer_session is not inner_session
+
+
+async def test_nested_savepoint_rolls_back_only_inner_call(
+    items: Repo[SmokeItem],
+) -> None:
+    @decorators.session(nested=True)
+    async def failing(*, session):
+        await items.create(SmokeItemIn(name="inner"), session=session)
+        raise ValueError
+
+    @decorators.session
+    async def outer(*, session):
+        await items.create(SmokeItemIn(name="outer"), session=session)
+        with pytest.raises(ValueError):
+            await failing()
+        return [item.name for item in (await items.all(session=session)).scalars()]
+
+    assert await outer() == ["outer"]
+
+
+async def test_serialization_failure_is_retried(db: Database) -> None:
+    attempts = []
+
+    async def func(session):
+        attempts.append(session)
+        if len(attempts) < 3:
+            await session.execute(SERIALIZATION_FAILURE)
+        return len(attempts)
+
+    assert await db.run_in_transaction(func, attempts=3) == 3
+
+
+async def test_retries_are_limited(db: Database) -> None:
+    attempts = []
+
+    async def func(session):
+        attempts.append(session)
+        await session.execute(SERIALIZATION_FAILURE)
+
+    with pytest.raises(DBAPIError):
+        await db.run_in_transaction(func, attempts=2)
+    assert len(attempts) == 2
+
+
+async def test_session_timeouts(db: Database) -> None:
+    with pytest.raises(DBAPIError) as e:
+        async with db.session(statement_timeout=0.05, lock_timeout=0.01) as session:
+            assert (await session.execute(SHOW_TIMEOUTS)).one() == ("50ms", "10ms")
+            await session.execute(text("SELECT pg_sleep(1)"))
+    # query_canceled
+    assert get_sqlstate(e.value) == "57014"
+
+
+async def test_context_timeouts_are_defaults(db: Database) -> None:
+    token = activate_timeouts(2, 1)
+    try:
+        async with db.session(new=True) as session:
+            assert (await session.execute(SHOW_TIMEOUTS)).one() == ("2s", "1s")
+        async with db.session(new=True, lock_timeout=3) as session:
+            assert (await session.execute(SHOW_TIMEOUTS)).one() == ("2s", "3s")
+    finally:
+        deactivate_timeouts(token)
+
+
+async def test_route_timeouts(db: Database) -> None:
+    router = APIRouter()
+
+    @router.get("/timeouts", statement_timeout=4)
+    async def timeouts() -> List[str]:
+        async with db.session(new=True) as session:
+            return list((await session.execute(SHOW_TIMEOUTS)).one())
+
+    app = FastAPI()
+    app.include_router(router)
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.get("/timeouts")
+    assert response.json()[0] == "4s"
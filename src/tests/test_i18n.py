@@ -0,0 +1,243 @@
+import asyncio
+import json
+import os
+import struct
+from pathlib import Path
+from typing import Dict, Iterator
+
+import pytest
+
+from config import i18n
+from config.i18n import (
+    LazyString,
+    MappedTranslations,
+    TranslationRegistry,
+    activate_translation,
+    deactivate_translation,
+    get_language,
+    gettext_lazy,
+    negotiate_language,
+)
+from utils.middleware import TranslationMiddleware
+from utils.pygettext import compile_bundle
+from utils.responses import JSONResponse
+
+RU_CATALOG = {
+    "": "Content-Type: text/plain; charset=UTF-8\n"
+    "Plural-Forms: nplurals=3; plural=(n%10==1 && n%100!=11 ? 0 : "
+    "n%10>=2 && n%10<=4 && (n%100<10 || n%100>=20) ? 1 : 2);\n",
+    "Not found.": "Не найдено.",
+    "%d item\0%d items": "%d элемент\0%d элемента\0%d элементов",
+    "button\x04Open": "Открыть",
+    "state\x04Open": "Открыто",
+    "cart\x04%d item\0%d items": "%d товар\0%d товара\0%d товаров",
+}
+
+
+def write_mo(path: Path, catalog: Dict[str, str]) -> None:
+    keys = sorted(key.encode("utf-8") for key in catalog)
+    values = [catalog[key.decode("utf-8")].encode("utf-8") for key in keys]
+    originals_offset = 7 * 4
+    translations_offset = originals_offset + len(keys) * 8
+    data_offset = translations_offset + len(keys) * 8
+    header = struct.pack(
+        "<7I", 0x950412DE, 0, len(keys), originals_offset, translations_offset, 0, 0
+    )
+    tables, data = [], b""
+    for strings in (keys, values):
+        table = b""
+        for string in strings:
+            table += struct.pack("<2I", len(string), data_offset + len(data))
+            data += string + b"\0"
+        tables.append(table)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(header + b"".join(tables) + data)
+
+
+@pytest.fixture
+def locale_dir(tmp_path: Path) -> Path:
+    write_mo(tmp_path / "ru" / "LC_MESSAGES" / "base.mo", RU_CATALOG)
+    return tmp_path
+
+
+@pytest.fixture
+def registry(locale_dir: Path) -> TranslationRegistry:
+    return TranslationRegistry("base", str(locale_dir), ["en", "ru"])
+
+
+def _compile(locale_dir: Path) -> Path:
+    mofile = locale_dir / "ru" / "LC_MESSAGES" / "base.mo"
+    bundle = mofile.with_suffix(".bundle")
+    compile_bundle(str(mofile), str(bundle))
+    # the bundle must not be older than the catalog
+    os.utime(mofile, (0, 0))
+    return bundle
+
+
+@pytest.mark.parametrize("bundled", [False, True])
+def test_catalog_lookups(
+    locale_dir: Path, registry: TranslationRegistry, bundled: bool
+) -> None:
+    if bundled:
+        _compile(locale_dir)
+    catalog = registry.get("ru")
+    assert isinstance(catalog, MappedTranslations) is bundled
+    assert catalog.gettext("Not found.") == "Не найдено."
+    assert catalog.gettext("Missing.") == "Missing."
+    assert [catalog.ngettext("%d item", "%d items", n) for n in (1, 3, 5, 21)] == [
+        "%d элемент",
+        "%d элемента",
+        "%d элементов",
+        "%d элемент",
+    ]
+    assert catalog.pgettext("button", "Open") == "Открыть"
+    assert catalog.pgettext("state", "Open") == "Открыто"
+    assert catalog.npgettext("cart", "%d item", "%d items", 2) == "%d товара"
+    assert catalog.npgettext("menu", "%d item", "%d items", 2) == "%d items"
+
+
+def test_outdated_bundle_falls_back_to_catalog(
+    locale_dir: Path, registry: TranslationRegistry
+) -> None:
+    bundle = _compile(locale_dir)
+    os.utime(bundle, (0, 0))
+    os.utime(bundle.with_suffix(".mo"))
+    assert not isinstance(registry.get("ru"), MappedTranslations)
+
+
+@pytest.mark.parametrize("size", [0, 5, 20])
+def test_broken_bundle_falls_back_to_catalog(
+    locale_dir: Path, registry: TranslationRegistry, size: int
+) -> None:
+    bundle = _compile(locale_dir)
+    with open(bundle, "r+b") as fp:
+        fp.truncate(size)
+    catalog = registry.get("ru")
+    assert not isinstance(catalog, MappedTranslations)
+    assert catalog.gettext("Not found.") == "Не найдено."
+
+
+def test_reload_keeps_old_catalogs_readable(
+    locale_dir: Path, registry: TranslationRegistry
+) -> None:
+    _compile(locale_dir)
+    old = registry.get("ru")
+    registry.reload()
+    assert registry.get("ru") is not old
+    assert old.gettext("Not found.") == "Не найдено."
+
+
+@pytest.fixture
+def ru(
+    registry: TranslationRegistry, monkeypatch: pytest.MonkeyPatch
+) -> Iterator[None]:
+    monkeypatch.setattr(i18n, "registry", registry)
+    token = activate_translation("ru")
+    yield
+    deactivate_translation(token)
+
+
+def test_lazy_string_is_translated_on_use(ru: None) -> None:
+    message = gettext_lazy("Not found.")
+    assert str(message) == "Не найдено."
+    assert message + "!" == "Не найдено.!"
+    assert JSONResponse({"detail": message}).body == json.dumps(
+        {"detail": "Не найдено."}, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def test_lazy_string_follows_reload(
+    ru: None, locale_dir: Path, registry: TranslationRegistry
+) -> None:
+    message = gettext_lazy("Not found.")
+    assert str(message) == "Не найдено."
+    write_mo(
+        locale_dir / "ru" / "LC_MESSAGES" / "base.mo",
+        {**RU_CATALOG, "Not found.": "Ничего не найдено."},
+    )
+    registry.reload()
+    assert str(message) == "Ничего не найдено."
+
+
+def test_lazy_string_equality_is_consistent_with_hash(ru: None) -> None:
+    message = gettext_lazy("Not found.")
+    assert message == LazyString("Not found.")
+    assert hash(message) == hash(LazyString("Not found."))
+    assert gettext_lazy(message) is message
+    # the translation depends on the language, the hash can't
+    assert message != "Не найдено."
+    assert message != "Not found."
+    assert len({message, LazyString("Not found."), "Not found."}) == 2
+
+
+def test_registry_loads_each_language_once(registry: TranslationRegistry) -> None:
+    registry.preload()
+    assert registry.stats() == {"hits": 0, "misses": 2, "loaded": 2}
+    assert registry.get("ru") is registry.get("ru")
+    assert registry.get("ru").gettext("Not found.") == "Не найдено."
+    # no catalog for en: messages are returned as is
+    assert registry.get("en").gettext("Not found.") == "Not found."
+    assert registry.stats() == {"hits": 4, "misses": 2, "loaded": 2}
+
+
+def test_translate_in_active_language(ru: None) -> None:
+    assert i18n._("Not found.") == "Не найдено."
+    token = activate_translation("en")
+    try:
+        assert i18n._("Not found.") == "Not found."
+    finally:
+        deactivate_translation(token)
+
+
+@pytest.mark.parametrize(
+    "header, lang",
+    [
+        (None, "en"),
+        ("", "en"),
+        ("ru", "ru"),
+        ("ru-RU,ru;q=0.9,en;q=0.8", "ru"),
+        ("de, en;q=0.5, ru;q=0.7", "ru"),
+        ("ru;q=0, en", "en"),
+        ("ru;q=abc, en;q=0.1", "en"),
+        ("de, fr", "en"),
+    ],
+)
+def test_negotiate_language(header: str | None, lang: str) -> None:
+    assert negotiate_language(header) == lang
+
+
+def test_activate_unsupported_language() -> None:
+    token = activate_translation("de")
+    try:
+        assert get_language() == "en"
+    finally:
+        deactivate_translation(token)
+
+
+@pytest.mark.asyncio(loop_scope="session")
+async def test_middleware_keeps_language_per_request() -> None:
+    languages = []
+
+    async def app(scope, receive, send):
+        await asyncio.sleep(0)
+        languages.append((scope.get("path"), get_language()))
+
+    middleware = TranslationMiddleware(app)
+    await asyncio.gather(
+        *(
+            middleware(
+                {"type": "http", "path": lang, "headers": [(b"accept-language", lang)]},
+                None,
+                None,
+            )
+            for lang in (b"ru", b"en", b"ru-RU")
+        ),
+        middleware({"type": "lifespan"}, None, None),
+    )
+    assert sorted(languages, key=str) == [
+        (None, "en"),
+        (b"en", "en"),
+        (b"ru", "ru"),
+        (b"ru-RU", "ru"),
+    ]
+    assert get_language() == "en"
@@ -0,0 +1,21 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from utils.cache import InMemoryCacheBackend
+from utils.repo import invalidate_on_commit
+
+
+def test_sync_commit_without_pending_invalidation() -> None:
+    with Session(create_engine("sqlite://")) as session:
+        session.execute(text("SELECT 1"))
+        session.commit()
+
+
+def test_sync_commit_invalidates_outside_event_loop() -> None:
+    cache = InMemoryCacheBackend()
+    cache.data["key"] = (b"value", float("inf"))
+    with Session(create_engine("sqlite://")) as session:
+        session.execute(text("SELECT 1"))
+        invalidate_on_commit(session, cache, "key")  # type: ignore[arg-type]
+        session.commit()
+    assert not cache.data
@@ -0,0 +1,40 @@
+import pytest
+
+from utils.metrics import Metric, MetricsRegistry
+
+
+def test_metric_is_abstract() -> None:
+    with pytest.raises(TypeError):
+        Metric("name", "description")  # type: ignore[abstract]
+
+
+def test_render() -> None:
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests.").inc(method="GET")
+    registry.gauge("connections", "Connections.").set_function(lambda: 3)
+    histogram = registry.histogram("duration_seconds", "Duration.", buckets=[0.1, 1])
+    histogram.observe(0.5)
+    histogram.observe(5)
+    assert registry.counter("requests_total", "Requests.").value(method="GET") == 1
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{method="GET"} 1',
+        "# HELP connections Connections.",
+        "# TYPE connections gauge",
+        "connections 3",
+        "# HELP duration_seconds Duration.",
+        "# TYPE duration_seconds histogram",
+        'duration_seconds_bucket{le="0.1"} 0',
+        'duration_seconds_bucket{le="1"} 1',
+        'duration_seconds_bucket{le="+Inf"} 2',
+        "duration_seconds_sum 5.5",
+        "duration_seconds_count 2",
+    ]
+
+
+def test_name_is_registered_once() -> None:
+    registry = MetricsRegistry()
+    registry.counter("requests_total", "Requests.")
+    with pytest.raises(AssertionError):
+        registry.gauge("requests_total", "Requests.")
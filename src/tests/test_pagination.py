@@ -0,0 +1,134 @@
+import asyncio
+from typing import Any, List, Tuple
+
+import pytest
+from fastapi_pagination import LimitOffsetPage, LimitOffsetParams
+from fastapi_pagination import paginate as paginate_list
+from fastapi_pagination.api import set_page
+from httpx import ASGITransport, AsyncClient
+
+from config.db import Database
+from tests.models import SmokeItem, SmokeItemIn
+from utils.app import FastAPI
+from utils.cache import InMemoryCacheBackend
+from utils.pagination import KeysetPage, KeysetParams, add_pagination
+from utils.repo import PENDING_INVALIDATION_KEY, Repo
+from utils.routing import APIRouter, CountMode
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+async def _page(
+    repo: Repo[SmokeItem], db: Database, limit: int = 2, offset: int = 0, **kwargs: Any
+) -> Tuple[List[str], int | None]:
+    async with db.session() as session:
+        with set_page(LimitOffsetPage[Any]):
+            page = await repo.page(
+                params=LimitOffsetParams(limit=limit, offset=offset),
+                session=session,
+                **kwargs,
+            )
+        return [item.name for item in page.items], page.total
+
+
+async def _create(repo: Repo[SmokeItem], db: Database, *names: str) -> None:
+    async with db.session() as session:
+        await repo.create_many(
+            [SmokeItemIn(name=name) for name in names], session=session
+        )
+
+
+@pytest.mark.parametrize("mode", [CountMode.EXACT, CountMode.WINDOW])
+async def test_exact_totals(
+    db: Database, items: Repo[SmokeItem], mode: CountMode
+) -> None:
+    await _create(items, db, *"abcde")
+    assert await _page(items, db, offset=1, count_mode=mode) == (["b", "c"], 5)
+    # past the last page the window has no row to carry the total
+    assert await _page(items, db, offset=10, count_mode=mode) == ([], 5)
+
+
+async def test_estimated_total(db: Database, items: Repo[SmokeItem]) -> None:
+    await _create(items, db, *"abcde")
+    names, total = await _page(items, db, count_mode=CountMode.ESTIMATE)
+    assert names == ["a", "b"]
+    assert isinstance(total, int)
+
+
+async def test_cached_total_is_invalidated_by_writes(db: Database) -> None:
+    cache = InMemoryCacheBackend()
+    async with db.session() as session:
+        connection = await session.connection()
+        await connection.run_sync(SmokeItem.__table__.create)
+    items = Repo(db, SmokeItem, "id", count_cache=cache)
+    await _create(items, db, *"abc")
+
+    assert await _page(items, db, count_mode=CountMode.CACHED) == (["a", "b"], 3)
+    # without a count cache writes leave the cached total alone
+    await _create(Repo(db, SmokeItem, "id"), db, "d")
+    assert await _page(items, db, count_mode=CountMode.CACHED) == (["a", "b"], 3)
+
+    await _create(items, db, "e")
+    await asyncio.sleep(0)
+    assert await _page(items, db, count_mode=CountMode.CACHED) == (["a", "b"], 5)
+
+
+async def test_writes_without_count_cache_schedule_nothing(
+    db: Database, items: Repo[SmokeItem]
+) -> None:
+    async with db.session() as session:
+        await items.create(SmokeItemIn(name="a"), session=session)
+        assert PENDING_INVALIDATION_KEY not in session.info
+
+
+async def test_add_pagination_to_routes_without_middleware() -> None:
+    router = APIRouter()
+
+    @router.get(
+        "/numbers", response_model=LimitOffsetPage[int], count_mode=CountMode.WINDOW
+    )
+    async def numbers() -> Any:
+        return paginate_list(list(range(5)))
+
+    app = FastAPI()
+    app.include_router(router)
+    add_pagination(app)
+    async with AsyncClient(
+        transport=ASGITransport(app=app), base_url="http://test"
+    ) as client:
+        response = await client.get("/numbers", params={"limit": 2, "offset": 1})
+    assert response.status_code == 200
+    assert response.json()["items"] == [1, 2]
+    assert response.json()["total"] == 5
+
+
+async def _keyset_pages(
+    repo: Repo[SmokeItem], db: Database, **kwargs: Any
+) -> List[List[str]]:
+    pages, cursor = [], None
+    async with db.session() as session:
+        with set_page(KeysetPage[Any]):
+            while True:
+                page = await repo.keyset_page(
+                    params=KeysetParams(cursor=cursor, size=2),
+                    session=session,
+                    **kwargs,
+                )
+                pages.append([item.name for item in page.items])
+                cursor = page.next_page
+                if cursor is None:
+                    return pages
+
+
+async def test_keyset_pages(db: Database, items: Repo[SmokeItem]) -> None:
+    async with db.session() as session:
+        await items.create_many(
+            [SmokeItemIn(name=name, age=age % 2) for age, name in enumerate("abcde")],
+            session=session,
+        )
+    assert await _keyset_pages(items, db) == [["a", "b"], ["c", "d"], ["e"]]
+    assert await _keyset_pages(items, db, order_by=["age"], descending=True) == [
+        ["d", "b"],
+        ["e", "c"],
+        ["a"],
+    ]
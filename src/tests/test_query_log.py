@@ -0,0 +1,113 @@
+import logging
+from typing import AsyncIterator, List
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from config.db import Database, QueryInstrumentation, collect_query_stats
+from config.di import TestContainer
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+ADVISORY_LOCKS = text("SELECT count(*) FROM pg_locks WHERE locktype = 'advisory'")
+
+
+def _plans(caplog: pytest.LogCaptureFixture) -> List[logging.LogRecord]:
+    # statements of the EXPLAIN connection are logged as slow too
+    return [r for r in caplog.records if not r.message.startswith("Slow query (")]
+
+
+@pytest_asyncio.fixture
+async def engine(database: Database) -> AsyncIterator[AsyncEngine]:
+    test_database = TestContainer.test_database()
+    engine = create_async_engine(
+        test_database.url.set(database=test_database.worker_name)
+    )
+    async with engine.begin() as connection:
+        await connection.execute(text("CREATE SEQUENCE explain_check"))
+    yield engine
+    async with engine.begin() as connection:
+        await connection.execute(text("DROP SEQUENCE explain_check"))
+    await engine.dispose()
+
+
+@pytest.fixture
+def instrumentation(engine: AsyncEngine) -> QueryInstrumentation:
+    return QueryInstrumentation(engine, slow_threshold=1e-9, explain_threshold=1e-9)
+
+
+async def test_slow_reads_are_logged_with_a_plan(
+    instrumentation: QueryInstrumentation,
+    engine: AsyncEngine,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    caplog.set_level(logging.WARNING, logger="slow_queries")
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+    await instrumentation._explain_tasks.pop()
+    assert caplog.records[0].message.startswith("Slow query (")
+    (plan,) = _plans(caplog)
+    assert plan.message == "Slow query plan - SELECT 1"
+    assert plan.plan[0]["Plan"]["Actual Loops"] == 1
+
+
+async def test_writes_are_not_explained(
+    instrumentation: QueryInstrumentation, engine: AsyncEngine
+) -> None:
+    async with engine.connect() as connection:
+        await connection.execute(text("CREATE TEMPORARY TABLE explain_writes (id int)"))
+        await connection.execute(text("INSERT INTO explain_writes VALUES (1)"))
+    assert not instrumentation._explain_tasks
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "SELECT nextval('explain_check')",
+        "SELECT pg_advisory_lock(42)",
+        "SELECT 1 FOR UPDATE",
+    ],
+)
+async def test_side_effects_are_not_analyzed(
+    instrumentation: QueryInstrumentation,
+    engine: AsyncEngine,
+    caplog: pytest.LogCaptureFixture,
+    statement: str,
+) -> None:
+    caplog.set_level(logging.WARNING, logger="slow_queries")
+    await instrumentation._explain(statement, ())
+    (plan,) = _plans(caplog)
+    assert "Actual Loops" not in plan.plan[0]["Plan"]
+    async with engine.connect() as connection:
+        assert not await connection.scalar(text("SELECT is_called FROM explain_check"))
+        assert await connection.scalar(ADVISORY_LOCKS) == 0
+
+
+async def test_query_stats(db: Database) -> None:
+    async with db.session() as session:
+        await session.execute(text("SELECT 0"))
+        with collect_query_stats() as stats:
+            await session.execute(text("SELECT 1"))
+            await session.execute(text("SELECT 2"))
+        await session.execute(text("SELECT 3"))
+    assert stats.count == 2
+    assert stats.duration > 0
+    assert stats.statements == {"SELECT 1": 1, "SELECT 2": 1}
+
+
+async def test_repeated_statements_are_reported(
+    db: Database, caplog: pytest.LogCaptureFixture
+) -> None:
+    caplog.set_level(logging.WARNING, logger="orm")
+    async with db.session() as session:
+        with collect_query_stats(repeat_threshold=2):
+            for value in range(4):
+                await session.execute(
+                    text("SELECT CAST(:value AS int)"), {"value": value}
+                )
+    (warning,) = caplog.records
+    assert warning.message.startswith("Possible N+1")
+    # the statement is logged with placeholders, without values
+    assert warning.statement == "SELECT CAST($1 AS int)"
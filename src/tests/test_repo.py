@@ -0,0 +1,283 @@
+import asyncio
+
+import pytest
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy.exc import DBAPIError
+
+from config.db import Database, collect_query_stats
+from tests.models import SmokeItem, SmokeItemIn
+from utils.cache import InMemoryCacheBackend
+from utils.exceptions import Custom404Exception
+from utils.repo import CachedRepo, Repo, enable_lookup_cache
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+
+class CountingCache(InMemoryCacheBackend):
+    def __init__(self) -> None:
+        super().__init__()
+        self.gets = 0
+
+    async def get(self, key: str) -> bytes | None:
+        self.gets += 1
+        return await super().get(key)
+
+
+async def _after_commit_hooks() -> None:
+    # invalidation after commit runs as a task
+    await asyncio.sleep(0)
+
+
+@pytest.fixture
+def cache() -> CountingCache:
+    return CountingCache()
+
+
+@pytest.fixture
+def cached_items(
+    items: Repo[SmokeItem], db: Database, cache: CountingCache
+) -> CachedRepo[SmokeItem]:
+    return CachedRepo(db, SmokeItem, "id", cache=cache)
+
+
+async def test_loader_batches_loads(db: Database, items: Repo[SmokeItem]) -> None:
+    async with db.session() as session:
+        created = await items.create_many(
+            [SmokeItemIn(name=name) for name in "abc"], session=session
+        )
+        ids = [item.id for item in created]
+    async with db.session() as session:
+        with collect_query_stats() as stats:
+            loaded = await items.loader(session=session).load_many(ids)
+        assert [item.id for item in loaded] == ids
+        # the isolated test session adds its savepoint to the stats
+        selects = [sql for sql in stats.statements if sql.startswith("SELECT")]
+        assert len(selects) == 1
+
+
+async def test_loader_sees_writes_of_the_session(
+    db: Database, items: Repo[SmokeItem]
+) -> None:
+    async with db.session() as session:
+        loader = items.loader(session=session)
+        with pytest.raises(Custom404Exception):
+            await loader.load(1)
+        item = await items.create(SmokeItemIn(name="a"), session=session)
+        assert await loader.load(item.id) is item
+        await items.delete(item, session=session)
+        with pytest.raises(Custom404Exception):
+            await loader.load(item.id)
+
+
+class SlowRepo(Repo[SmokeItem]):
+    active = max_active = 0
+
+    async def get_by_ids(self, ids, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(0.01)
+            return await super().get_by_ids(ids, **kwargs)
+        finally:
+            self.active -= 1
+
+
+async def test_loader_runs_one_batch_at_a_time(
+    db: Database, items: Repo[SmokeItem]
+) -> None:
+    slow_items = SlowRepo(db, SmokeItem, "id")
+    async with db.session() as session:
+        first, second = await items.create_many(
+            [SmokeItemIn(name="a"), SmokeItemIn(name="b")], session=session
+        )
+        loader = slow_items.loader(session=session)
+        load_first = asyncio.create_task(loader.load(first.id))
+        # the first batch is still running
+        await asyncio.sleep(0.001)
+        assert await loader.load(second.id) is second
+        assert await load_first is first
+    assert slow_items.max_active == 1
+
+
+async def test_cached_repo_does_not_cache_uncommitted_rows(
+    db: Database, cached_items: CachedRepo[SmokeItem], cache: CountingCache
+) -> None:
+    async with db.session() as session:
+        item = await cached_items.create(SmokeItemIn(name="a", age=1), session=session)
+        item_id = item.id
+    await _after_commit_hooks()
+
+    with pytest.raises(ValueError):
+        async with db.session() as session:
+            item = await cached_items.get_by_id(item_id, session=session)
+            await cached_items.update(item, {"age": 777}, session=session)
+            assert (await cached_items.get_by_id(item_id, session=session)).age == 777
+            raise ValueError
+    assert not cache.data
+
+    async with db.session() as session:
+        assert (await cached_items.get_by_id(item_id, session=session)).age == 1
+
+
+async def test_cached_repo_invalidates_after_commit(
+    db: Database, cached_items: CachedRepo[SmokeItem], cache: CountingCache
+) -> None:
+    async with db.session() as session:
+        item = await cached_items.create(SmokeItemIn(name="a", age=1), session=session)
+        item_id = item.id
+    await _after_commit_hooks()
+
+    async with db.session() as session:
+        item = await cached_items.get_by_id(item_id, session=session)
+        await cached_items.update(item, {"age": 2}, session=session)
+        # a concurrent reader caches the committed row before the commit
+        async with db.session(new=True) as reader:
+            await cached_items.get_by_id(item_id, session=reader)
+        assert cache.data
+    await _after_commit_hooks()
+
+    assert not cache.data
+    async with db.session() as session:
+        assert (await cached_items.get_by_id(item_id, session=session)).age == 2
+
+
+async def test_cached_repo_fills_lookup_cache(
+    db: Database, cached_items: CachedRepo[SmokeItem], cache: CountingCache
+) -> None:
+    async with db.session() as session:
+        item = await cached_items.create(SmokeItemIn(name="a"), session=session)
+        item_id = item.id
+    await _after_commit_hooks()
+
+    async with db.session() as session:
+        enable_lookup_cache(session)
+        for _ in range(3):
+            await cached_items.get_by_id(item_id, session=session)
+    assert cache.gets == 1
+
+
+class AdultItems(Repo[SmokeItem]):
+    min_age = 18
+
+    def all_as_select(self):
+        return super().all_as_select().filter(SmokeItem.age >= self.min_age)
+
+
+async def test_lookups_reuse_statements(db: Database, items: Repo[SmokeItem]) -> None:
+    async with db.session() as session:
+        await items.create(SmokeItemIn(name="a"), session=session)
+        assert await items.get_by_field("name", "a", session=session)
+        assert await items.exists_by_field("name", "a", session=session)
+    assert items._field_select("name") is items._field_select("name")
+
+
+async def test_lookups_apply_overridden_all_as_select(
+    db: Database, items: Repo[SmokeItem]
+) -> None:
+    adults = AdultItems(db, SmokeItem, "id")
+    async with db.session() as session:
+        await items.create(SmokeItemIn(name="a", age=20), session=session)
+        assert await adults.exists_by_field("name", "a", session=session)
+        assert await adults.get_by_field("name", "a", session=session)
+        adults.min_age = 21
+        assert not await adults.exists_by_field("name", "a", session=session)
+        with pytest.raises(Custom404Exception):
+            await adults.get_by_field("name", "a", session=session)
+
+
+async def test_exists(db: Database, items: Repo[SmokeItem]) -> None:
+    async with db.session() as session:
+        await items.create_many(
+            [SmokeItemIn(name="a"), SmokeItemIn(name="b")], session=session
+        )
+        assert await items.exists_by_field("name", "a", session=session)
+        assert not await items.exists_by_field("name", "c", session=session)
+        with collect_query_stats() as stats:
+            found = await items.exists_many(
+                "name", ["a", "c", "b", "a"], session=session
+            )
+        assert found == {"a", "b"}
+        assert stats.count == 1
+        assert await items.exists_many("name", [], session=session) == set()
+
+
+async def test_returning(db: Database, items: Repo[SmokeItem]) -> None:
+    async with db.session() as session:
+        item = await items.create_returning(SmokeItemIn(name="a"), session=session)
+        assert (item.name, item.age) == ("a", 0)
+        row = await items.create_returning(
+            SmokeItemIn(name="b", age=2), columns=["id", "age"], session=session
+        )
+        assert row == {"id": item.id + 1, "age": 2}
+
+        updated = await items.update_returning(item, {"age": 5}, session=session)
+        assert updated is item
+        assert item.age == 5
+        assert await items.update_returning(
+            item, {"age": 6}, columns=["age"], session=session
+        ) == {"age": 6}
+
+        rows = await items.multi_update_returning(
+            [item.id, row["id"]], values={"age": 7}, columns=["age"], session=session
+        )
+        assert rows == [{"age": 7}, {"age": 7}]
+        assert await items.multi_update_returning([], values={}, session=session) == []
+
+        await items.delete(item, session=session)
+        with pytest.raises(Custom404Exception):
+            await items.update_returning(item, {"age": 1}, session=session)
+
+
+class ItemName(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    name: str
+
+
+class ItemLabel(BaseModel):
+    model_config = ConfigDict(from_attributes=True, populate_by_name=True)
+
+    label: str = Field(alias="name")
+    age: int
+
+
+async def test_project(db: Database, items: Repo[SmokeItem]) -> None:
+    async with db.session() as session:
+        await items.create_many(
+            [SmokeItemIn(name="a", age=1), SmokeItemIn(name="b", age=2)],
+            session=session,
+        )
+        session.expunge_all()
+        names = await items.project(ItemName, session=session)
+        assert sorted(names, key=lambda item: item.name) == [
+            ItemName(name="a"),
+            ItemName(name="b"),
+        ]
+        assert await items.project(ItemLabel, "age", 2, session=session) == [
+            ItemLabel(label="b", age=2)
+        ]
+        assert await items.project(["name", "age"], "name", "a", session=session) == [
+            {"name": "a", "age": 1}
+        ]
+        # only the projected columns are selected, no ORM objects are built
+        assert not session.identity_map
+
+
+async def test_claim_batch_skips_locked_rows(
+    database: Database, committed_items: Repo[SmokeItem]
+) -> None:
+    async with database.session(new=True) as session:
+        await committed_items.create_many(
+            [SmokeItemIn(name=name, age=age % 2) for age, name in enumerate("abcde")],
+            session=session,
+        )
+    async with database.session(new=True) as first:
+        claimed = await committed_items.claim_batch({"age": 0}, 2, session=first)
+        assert [item.name for item in claimed] == ["a", "c"]
+        async with database.session(new=True) as second:
+            claimed = await committed_items.claim_batch({"age": 0}, 2, session=second)
+            assert [item.name for item in claimed] == ["e"]
+            with pytest.raises(DBAPIError):
+                await committed_items.claim_batch(
+                    {"age": 0}, 2, nowait=True, session=second
+                )
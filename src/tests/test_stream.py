@@ -0,0 +1,60 @@
+from contextlib import aclosing
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+
+from config.db import Database
+from tests.models import SmokeItem, SmokeItemIn
+from utils.repo import Repo
+
+pytestmark = pytest.mark.asyncio(loop_scope="session")
+
+# the unnamed portal is the query itself
+OPEN_CURSORS = text("SELECT count(*) FROM pg_cursors WHERE name <> ''")
+
+
+@pytest_asyncio.fixture
+async def five_items(db: Database, items: Repo[SmokeItem]) -> Repo[SmokeItem]:
+    async with db.session() as session:
+        await items.create_many(
+            [SmokeItemIn(name=name, age=age % 2) for age, name in enumerate("abcde")],
+            session=session,
+        )
+    return items
+
+
+async def test_stream(db: Database, five_items: Repo[SmokeItem]) -> None:
+    async with db.session() as session:
+        stream = five_items.stream(batch_size=2, session=session)
+        assert sorted([item.name async for item in stream]) == list("abcde")
+        stream = five_items.stream("age", 1, batch_size=2, session=session)
+        assert sorted([item.name async for item in stream]) == ["b", "d"]
+
+
+async def test_stream_batches(db: Database, five_items: Repo[SmokeItem]) -> None:
+    async with db.session() as session:
+        sizes = [
+            len(batch)
+            async for batch in five_items.stream_batches(size=2, session=session)
+        ]
+        assert sizes == [2, 2, 1]
+
+
+async def test_stream_stopped_early(
+    database: Database, committed_items: Repo[SmokeItem]
+) -> None:
+    async with database.session(new=True) as session:
+        await committed_items.create_many(
+            [SmokeItemIn(name=name) for name in "abcde"], session=session
+        )
+    async with database.session(new=True) as session:
+        stream = committed_items.stream(batch_size=2, session=session)
+        async with aclosing(stream) as items:
+            async for _item in items:
+                assert await session.scalar(OPEN_CURSORS) == 1
+                break
+        assert len((await committed_items.all(session=session)).all()) == 5
+    # asyncpg portals live until the end of the transaction
+    async with database.session(new=True) as session:
+        assert await session.scalar(OPEN_CURSORS) == 0
@@ -25,10 +25,11 @@ from fastapi.utils import generate_unique_id
 from starlette.exceptions import HTTPException
 from starlette.middleware import Middleware
 from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.responses import Response
 from starlette.routing import BaseRoute
 from starlette.types import ASGIApp, Lifespan
 
+from utils.responses import JSONResponse
 from utils.routing import APIRouter
 
 
@@ -0,0 +1,73 @@
+"""
+Микробенчмарк подготовки запросов Repo.get_by_id/get_by_field без БД:
+сборка select() на каждый вызов против шаблона из Repo._field_select.
+В обоих случаях вычисляется ключ кэша компиляции и берется
+скомпилированный запрос из кэша, как это делает Session.execute
+
+Запуск: python -m utils.benchmarks [число итераций]
+"""
+
+import sys
+import timeit
+from typing import Any, Callable, Dict
+
+from sqlalchemy import String, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from config.db import Database
+from utils.repo import Repo
+
+DIALECT = postgresql.asyncpg.dialect()
+
+
+class _Base(DeclarativeBase):
+    pass
+
+
+class BenchmarkModel(_Base):
+    __tablename__ = "benchmark"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    name: Mapped[str] = mapped_column(String(50), unique=True)
+
+
+def _prepare(compiled_cache: Dict[Any, Any]) -> Callable[[Any], None]:
+    def prepare(statement: Any) -> None:
+        statement._compile_w_cache(
+            DIALECT, compiled_cache=compiled_cache, column_keys=[]
+        )
+
+    return prepare
+
+
+def run(number: int = 100_000) -> Dict[str, float]:
+    """
+    Возвращает среднее время подготовки одного запроса в микросекундах
+    """
+    repo = Repo(
+        Database("postgresql+asyncpg://benchmark@localhost/benchmark"),
+        BenchmarkModel,
+        "id",
+    )
+    prepare = _prepare({})
+
+    def rebuilt() -> None:
+        prepare(select(BenchmarkModel).filter(BenchmarkModel.name == "value"))
+
+    def template() -> None:
+        prepare(repo._field_select("name"))
+
+    results = {}
+    for name, func in (("rebuilt", rebuilt), ("template", template)):
+        func()
+        seconds = min(timeit.repeat(func, number=number, repeat=5))
+        results[name] = seconds / number * 1_000_000
+    return results
+
+
+if __name__ == "__main__":
+    results = run(*(int(arg) for arg in sys.argv[1:2]))
+    for name, value in results.items():
+        print(f"{name:>10}: {value:.2f} us/query")
+    print(f"{'speedup':>10}: {results['rebuilt'] / results['template']:.1f}x")
@@ -0,0 +1,83 @@
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Tuple
+
+from redis import RedisError
+from redis.asyncio import Redis
+
+logger = logging.getLogger("cache")
+
+
+class ICacheBackend(ABC):
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None: ...
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: int) -> None: ...
+    @abstractmethod
+    async def delete(self, *keys: str) -> None: ...
+
+
+class RedisCacheBackend(ICacheBackend):
+    """
+    Ошибки Redis не пробрасываются: кэш недоступен - чтение идет в БД
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        password: str | None = None,
+        db: int = 0,
+    ) -> None:
+        self.client = Redis(host=host, port=port, password=password or None, db=db)
+
+    async def get(self, key: str) -> bytes | None:
+        try:
+            return await self.client.get(key)
+        except RedisError as e:
+            logger.warning(f"Cache get failed - {str(e)}", exc_info=e)
+            return None
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        try:
+            await self.client.set(key, value, ex=ttl)
+        except RedisError as e:
+            logger.warning(f"Cache set failed - {str(e)}", exc_info=e)
+
+    async def delete(self, *keys: str) -> None:
+        if not keys:
+            return
+        try:
+            await self.client.delete(*keys)
+        except RedisError as e:
+            logger.error(f"Cache invalidation failed - {str(e)}", exc_info=e)
+
+
+class InMemoryCacheBackend(ICacheBackend):
+    """
+    Кэш в памяти процесса, заменяет Redis в тестах
+    """
+
+    def __init__(self) -> None:
+        self.data: Dict[str, Tuple[bytes, float]] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires_at = item
+        if expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            return None
+        return value
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        self.data[key] = (value, time.monotonic() + ttl)
+
+    async def delete(self, *keys: str) -> None:
+        for key in keys:
+            self.data.pop(key, None)
+
+    def clear(self) -> None:
+        self.data = {}
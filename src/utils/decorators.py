@@ -1,12 +1,34 @@
+import asyncio
 import functools
 import logging
-from typing import Any, Callable, Iterable
+from contextvars import ContextVar
+from typing import Any, Callable, Iterable, Tuple
 
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 
 orm_logger = logging.getLogger("orm")
 common_logger = logging.getLogger("common")
 
+# session of the current unit of work, whether it is readonly and the task
+# that opened it: child tasks inherit the context, but must not share a session
+_SessionOwner = Tuple[AsyncSession, bool, asyncio.Task | None]
+_current_session: ContextVar[_SessionOwner | None] = ContextVar(
+    "current_session", default=None
+)
+
+
+def _own_session() -> Tuple[AsyncSession, bool] | None:
+    current = _current_session.get()
+    if current is None or current[2] is not asyncio.current_task():
+        return None
+    return current[0], current[1]
+
+
+def get_current_session() -> AsyncSession | None:
+    current = _own_session()
+    return current[0] if current is not None else None
+
 
 def apply_tags(tags: Iterable[str]):
     """
@@ -66,15 +88,73 @@ def handle_any_error(
     return decorator
 
 
-def session(func) -> Callable:
-    async def wrapper(*args: Any, **kwargs: Any) -> Any:
-        from config.di import Container
+def session(
+    func: Callable | None = None,
+    *,
+    readonly: bool = False,
+    lookup_cache: bool = False,
+    nested: bool = False,
+    new: bool = False,
+    attempts: int | None = None,
+    statement_timeout: float | None = None,
+    lock_timeout: float | None = None,
+):
+    """
+    Декоратор передает в функцию сессию БД, если она не была передана явно.
+    Вложенные вызовы присоединяются к сессии внешнего вызова
+    (вызовы из дочерних задач - asyncio.gather, create_task - открывают свою),
+    nested=True оборачивает вызов в SAVEPOINT,
+    new=True открывает отдельную сессию со своей транзакцией.
+    Транзакция внешнего вызова повторяется целиком при ошибке сериализации
+    или дедлоке, attempts - число попыток (по умолчанию из настроек БД).
+    statement_timeout, lock_timeout - таймауты новой транзакции в секундах.
+    readonly=True направляет новую сессию на реплику,
+    lookup_cache=True включает кэш выборок репозиториев в рамках сессии
+    """
+
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            from config.di import Container
+            from utils.repo import enable_lookup_cache
+
+            if "session" in kwargs.keys():
+                return await func(*args, **kwargs)
+
+            current = _own_session()
+            # a write call can't join a session opened on a replica
+            if current is not None and not new and (readonly or not current[1]):
+                session = kwargs["session"] = current[0]
+                if lookup_cache:
+                    enable_lookup_cache(session)
+                if not nested:
+                    return await func(*args, **kwargs)
+                async with session.begin_nested():
+                    return await func(*args, **kwargs)
+
+            async def run(session: AsyncSession) -> Any:
+                if lookup_cache:
+                    enable_lookup_cache(session)
+                token = _current_session.set(
+                    (session, readonly, asyncio.current_task())
+                )
+                try:
+                    return await func(*args, **kwargs, session=session)
+                finally:
+                    _current_session.reset(token)
+
+            return await Container.db().run_in_transaction(
+                run,
+                readonly=readonly,
+                new=new or current is not None,
+                attempts=attempts,
+                statement_timeout=statement_timeout,
+                lock_timeout=lock_timeout,
+            )
 
-        if "session" in kwargs.keys():
-            return await func(*args, **kwargs)
+        return wrapper
 
-        async with Container.db().session() as session:
-            kwargs["session"] = session
-            return await func(*args, **kwargs)
+    if func is not None:
+        return decorator(func)
 
-    return wrapper
+    return decorator
@@ -6,16 +6,19 @@ from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import HTTPException, RequestValidationError
 from fastapi.utils import is_body_allowed_for_status_code
 from starlette.requests import Request
-from starlette.responses import JSONResponse, Response
+from starlette.responses import Response
 from starlette.status import (
     HTTP_422_UNPROCESSABLE_ENTITY,
     HTTP_500_INTERNAL_SERVER_ERROR,
 )
 
-from config.i18n import _
+from config.i18n import gettext_lazy
+from utils.responses import JSONResponse
 
 logger = logging.getLogger("exceptions")
 
+INTERNAL_ERROR_MESSAGE = gettext_lazy("An internal error has occurred.")
+
 
 class CustomException(HTTPException):
     pass
@@ -54,7 +57,9 @@ def custom_exception_handler(request: Request, exc: HTTPException) -> Response:
     if not is_body_allowed_for_status_code(exc.status_code):
         return Response(status_code=exc.status_code, headers=headers)
     return JSONResponse(
-        {"detail": exc.detail}, status_code=exc.status_code, headers=headers
+        {"detail": exc.detail},
+        status_code=exc.status_code,
+        headers=headers,
     )
 
 
@@ -82,5 +87,5 @@ async def internal_exception_handler(request: Request, exc: Exception):
     )
     return JSONResponse(
         status_code=HTTP_500_INTERNAL_SERVER_ERROR,
-        content={"detail": _("An internal error has occurred.")},
+        content={"detail": INTERNAL_ERROR_MESSAGE},
     )
@@ -5,6 +5,7 @@ import json
 import logging
 import os
 import traceback
+from contextvars import ContextVar, Token
 from pathlib import Path
 from typing import Dict, Union
 
@@ -13,6 +14,8 @@ from pydantic import BaseModel, Field, ConfigDict
 from config import settings
 
 EMPTY_VALUE = ""
+REQUEST_ID_HEADER = "x-request-id"
+_request_id: ContextVar[str | None] = ContextVar("request_id", default=None)
 BUILTIN_RECORD_ATTRS_TO_IGNORE = set(
     (
         "name",
@@ -34,6 +37,18 @@ BUILTIN_RECORD_ATTRS_TO_IGNORE = set(
 )
 
 
+def get_request_id() -> str | None:
+    return _request_id.get()
+
+
+def activate_request_id(request_id: str) -> Token[str | None]:
+    return _request_id.set(request_id)
+
+
+def deactivate_request_id(token: Token[str | None]) -> None:
+    _request_id.reset(token)
+
+
 class BaseJsonLogSchema(BaseModel):
     """
     Схема основного тела лога в формате JSON
@@ -55,6 +70,7 @@ class BaseJsonLogSchema(BaseModel):
     trace_id: str | None = None
     span_id: str | None = None
     parent_id: str | None = None
+    request_id: str | None = None
 
 
 class RequestJsonLogSchema(BaseModel):
@@ -80,6 +96,8 @@ class RequestJsonLogSchema(BaseModel):
     response_headers: Dict
     response_body: Dict
     duration: int
+    db_query_count: int = 0
+    db_duration: int = 0
 
 
 class JSONLogFormatter(logging.Formatter):
@@ -115,6 +133,7 @@ class JSONLogFormatter(logging.Formatter):
         )
         message = record.getMessage()
         duration = record.duration if hasattr(record, "duration") else record.msecs
+        request_id = getattr(record, "request_id", None) or get_request_id()
         # Инициализация тела журнала
         json_log_fields = BaseJsonLogSchema(
             thread=record.process,
@@ -127,10 +146,12 @@ class JSONLogFormatter(logging.Formatter):
             app_name="APP",
             app_version="APP_VERSION",
             app_env="ENVIRONMENT",
+            **({"request_id": request_id} if request_id else {}),
             **{
                 field: value
                 for field, value in record.__dict__.items()
                 if field not in BaseJsonLogSchema.model_fields.keys()
+                and field != "request_id"
                 and field not in BUILTIN_RECORD_ATTRS_TO_IGNORE
             },
         )
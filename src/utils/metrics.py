@@ -0,0 +1,184 @@
+import bisect
+import threading
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+LabelValues = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _labels(labels: Dict[str, str]) -> LabelValues:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = ",".join(f'{key}="{value}"' for key, value in labels)
+    return "{" + pairs + "}" if pairs else ""
+
+
+class Metric(ABC):
+    type_ = ""
+
+    def __init__(self, name: str, description: str) -> None:
+        self.name = name
+        self.description = description
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def samples(self) -> List[Tuple[str, LabelValues, float]]: ...
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.type_}",
+        ]
+        for name, labels, value in self.samples():
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Counter(Metric):
+    type_ = "counter"
+
+    def __init__(self, name: str, description: str) -> None:
+        super().__init__(name, description)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(_labels(labels), 0)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Metric):
+    type_ = "gauge"
+
+    def __init__(self, name: str, description: str) -> None:
+        super().__init__(name, description)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels: str) -> None:
+        self._values[_labels(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels: str) -> None:
+        """
+        Значение вычисляется только в момент выдачи метрик
+        """
+        self._functions[_labels(labels)] = function
+
+    def value(self, **labels: str) -> float:
+        key = _labels(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        return [(self.name, key, value) for key, value in self._values.items()] + [
+            (self.name, key, function()) for key, function in self._functions.items()
+        ]
+
+
+class Histogram(Metric):
+    type_ = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, description)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: bucket counts (+Inf last), sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _labels(labels)
+        with self._lock:
+            counts, total = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0])
+            )
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            total[0] += value
+
+    def count(self, **labels: str) -> int:
+        counts, _total = self._values.get(_labels(labels), ([], []))
+        return sum(counts)
+
+    def samples(self) -> List[Tuple[str, LabelValues, float]]:
+        samples = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                samples.append(
+                    (f"{self.name}_bucket", (*key, ("le", str(bound))), cumulative)
+                )
+            samples.append((f"{self.name}_sum", key, total[0]))
+            samples.append((f"{self.name}_count", key, cumulative))
+        return samples
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса. Метрики создаются один раз и переиспользуются
+    по имени, выдача в текстовом формате Prometheus
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls: type, name: str, *args, **kwargs) -> Metric:
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.setdefault(name, cls(name, *args, **kwargs))
+        assert isinstance(metric, cls), f"Metric {name} is already registered"
+        return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        return self._get_or_create(Counter, name, description)  # type: ignore
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        return self._get_or_create(Gauge, name, description)  # type: ignore
+
+    def histogram(
+        self,
+        name: str,
+        description: str,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._get_or_create(  # type: ignore
+            Histogram, name, description, buckets=buckets
+        )
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
@@ -3,13 +3,24 @@ import json
 import logging
 import math
 import time
+import uuid
+from contextvars import Token
 from typing import Dict
 
 from fastapi import Request, Response
 from starlette.types import Receive, Scope, Send
 
+from config import settings
+from config.db import collect_query_stats
+from config.i18n import activate_translation, deactivate_translation, negotiate_language
 from config.settings import PORT
-from utils.logging import EMPTY_VALUE, RequestJsonLogSchema
+from utils.logging import (
+    EMPTY_VALUE,
+    REQUEST_ID_HEADER,
+    RequestJsonLogSchema,
+    activate_request_id,
+    deactivate_request_id,
+)
 
 requests_logger = logging.getLogger("requests")
 
@@ -25,19 +36,54 @@ class TranslationMiddleware:
     async def __call__(self, scope: Scope, receive: Receive, send: Send):
         if not scope["type"] == "http":
             await self._app(scope, receive, send)
+            return
 
         headers = self._get_headers(scope)
-        self._activate_translation(headers)
-
-        await self._app(scope, receive, send)
+        token = self._activate_translation(headers)
+        try:
+            await self._app(scope, receive, send)
+        finally:
+            deactivate_translation(token)
 
     def _get_headers(self, scope: Scope) -> Dict:
         return headers_from_scope(scope)
 
-    def _activate_translation(self, headers: Dict) -> None:
-        from config.i18n import activate_translation
+    def _activate_translation(self, headers: Dict) -> Token[str]:
+        return activate_translation(
+            negotiate_language(headers.get("accept-language", None))
+        )
+
+
+class RequestIdMiddleware:
+    """
+    Берет id запроса из заголовка X-Request-ID или генерирует новый,
+    id доступен в логах запроса и возвращается в ответе
+    """
+
+    def __init__(self, app):
+        self._app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not scope["type"] == "http":
+            await self._app(scope, receive, send)
+            return
+
+        request_id = (
+            headers_from_scope(scope).get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        )
 
-        activate_translation(headers.get("accept-language", None))
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", []).append(
+                    (REQUEST_ID_HEADER.encode(), request_id.encode())
+                )
+            await send(message)
+
+        token = activate_request_id(request_id)
+        try:
+            await self._app(scope, receive, send_with_request_id)
+        finally:
+            deactivate_request_id(token)
 
 
 class LoggingMiddleware:
@@ -86,8 +132,13 @@ class LoggingMiddleware:
         server: tuple = request.get("server", ("localhost", PORT))
         request_headers: dict = dict(request.headers.items())
         # Response Side
+        # предупреждения о N+1 только вне прода, итоги по БД пишутся всегда
+        query_stats = collect_query_stats(
+            None if settings.PROD else settings.DB_N_PLUS_ONE_THRESHOLD
+        )
         try:
-            response = await call_next(request)
+            with query_stats as stats:
+                response = await call_next(request)
         except Exception as ex:
             response_body = bytes(http.HTTPStatus.INTERNAL_SERVER_ERROR.phrase.encode())
             response = Response(
@@ -133,6 +184,8 @@ class LoggingMiddleware:
             response_headers=response_headers,
             response_body=response_body_map or {},
             duration=duration,
+            db_query_count=stats.count,
+            db_duration=math.ceil(stats.duration * 1000),
         ).model_dump()
         # Хочется на каждый запрос читать
         # и понимать в сообщении самое главное,
@@ -1,20 +1,309 @@
+import base64
+import binascii
+import functools
+import hashlib
+import hmac
+import json
+import uuid
 from contextlib import asynccontextmanager
-from typing import Any, AsyncIterator, Type, TypeVar, cast
+from contextvars import ContextVar
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Generic,
+    List,
+    Optional,
+    Sequence,
+    Type,
+    TypeVar,
+    cast,
+)
 
-from fastapi import Depends
+from fastapi import Depends, Query
 from fastapi.dependencies.utils import (
     get_body_field,
     get_parameterless_sub_dependant,
     lenient_issubclass,
 )
-from fastapi_pagination.api import pagination_ctx
-from fastapi_pagination.bases import AbstractPage
+from fastapi.encoders import jsonable_encoder
+from fastapi_pagination.api import create_page, pagination_ctx
+from fastapi_pagination.bases import (
+    AbstractPage,
+    AbstractParams,
+    CursorRawParams,
+    RawParams,
+)
+from fastapi_pagination.utils import create_pydantic_model, verify_params
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from sqlalchemy import Column, Select, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from sqlalchemy.sql.util import find_tables
 from starlette.routing import request_response
 
+from config import settings
+from config.i18n import gettext_lazy
 from utils.app import FastAPI
-from utils.routing import APIRoute
+from utils.cache import ICacheBackend
+from utils.exceptions import Custom400Exception
+from utils.routing import APIRoute, CountMode
 
 ParentT = TypeVar("ParentT", APIRoute, FastAPI)
+T = TypeVar("T")
+
+INVALID_CURSOR_MESSAGE = gettext_lazy("Invalid cursor.")
+CURSOR_SIGNATURE_SIZE = 16
+COUNT_CACHE_PREFIX = "count"
+_count_mode: ContextVar[CountMode] = ContextVar("count_mode", default=CountMode.EXACT)
+
+
+class KeysetParams(BaseModel, AbstractParams):
+    cursor: str | None = Query(None, description="Cursor for the next page")
+    size: int = Query(50, ge=1, le=100, description="Page size")
+
+    def to_raw_params(self) -> CursorRawParams:
+        return CursorRawParams(cursor=self.cursor, size=self.size)
+
+
+class KeysetPage(AbstractPage[T], Generic[T]):
+    items: Sequence[T]
+    next_page: str | None = None
+
+    __params_type__ = KeysetParams
+
+    @classmethod
+    def create(
+        cls,
+        items: Sequence[T],
+        params: AbstractParams,
+        *,
+        next_: str | None = None,
+        **kwargs: Any,
+    ) -> "KeysetPage[T]":
+        return create_pydantic_model(cls, items=items, next_page=next_, **kwargs)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+@functools.lru_cache
+def column_adapter(column: Column) -> TypeAdapter:
+    """
+    Валидатор значений колонки, для типов без python_type (JSON и т.п.) - Any
+    """
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        python_type = Any
+    return TypeAdapter(Optional[python_type])
+
+
+def _sign(payload: bytes) -> bytes:
+    if not settings.SECRET_KEY:
+        # an empty key would let anyone forge cursors
+        raise RuntimeError("SECRET_KEY is required to sign pagination cursors")
+    return hmac.new(settings.SECRET_KEY.encode(), payload, hashlib.sha256).digest()[
+        :CURSOR_SIGNATURE_SIZE
+    ]
+
+
+def encode_cursor(columns: Sequence[Column], values: Sequence[Any]) -> str:
+    """
+    Курсор - значения ключей сортировки последней записи страницы,
+    подписанные SECRET_KEY
+    """
+    payload = json.dumps(
+        {"k": [column.key for column in columns], "v": jsonable_encoder(values)},
+        separators=(",", ":"),
+    ).encode()
+    return f"{_b64encode(payload)}.{_b64encode(_sign(payload))}"
+
+
+def decode_cursor(cursor: str, columns: Sequence[Column]) -> List[Any]:
+    try:
+        payload_part, _sep, signature_part = cursor.partition(".")
+        payload = _b64decode(payload_part)
+        if not hmac.compare_digest(_b64decode(signature_part), _sign(payload)):
+            raise ValueError("Bad signature")
+        data = json.loads(payload)
+        if data["k"] != [column.key for column in columns]:
+            raise ValueError("Cursor belongs to another ordering")
+        return [
+            column_adapter(column).validate_python(value)
+            for column, value in zip(columns, data["v"], strict=True)
+        ]
+    except (ValueError, KeyError, TypeError, binascii.Error, ValidationError):
+        raise Custom400Exception(INVALID_CURSOR_MESSAGE)
+
+
+async def paginate_keyset(
+    session: AsyncSession,
+    query: Select,
+    order_by: Sequence[Column],
+    *,
+    descending: bool = False,
+    params: KeysetParams | None = None,
+) -> Any:
+    """
+    Пагинация по ключу: вместо OFFSET страница начинается с условия
+    (order_by) > (значения из курсора), поэтому стоимость любой страницы
+    одинакова при наличии индекса по order_by.
+    Набор order_by должен быть уникальным (например, заканчиваться на pk)
+    """
+    params, raw_params = verify_params(params, "cursor")
+    raw_params = cast(CursorRawParams, raw_params)
+
+    key = tuple_(*order_by)
+    if raw_params.cursor:
+        values = tuple_(*decode_cursor(str(raw_params.cursor), order_by))
+        query = query.filter(key < values if descending else key > values)
+    query = query.order_by(
+        *(column.desc() if descending else column.asc() for column in order_by)
+    ).limit(raw_params.size + 1)
+
+    items = list((await session.scalars(query)).all())
+    next_ = None
+    if len(items) > raw_params.size:
+        items = items[: raw_params.size]
+        next_ = encode_cursor(
+            order_by, [getattr(items[-1], column.key) for column in order_by]
+        )
+    return create_page(items, params=params, next_=next_)
+
+
+class _Explain(Executable, ClauseElement):
+    inherit_cache = False
+
+    def __init__(self, statement: Select) -> None:
+        self.statement = statement
+
+
+@compiles(_Explain, "postgresql")
+def _compile_explain(element: _Explain, compiler: Any, **kwargs: Any) -> str:
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kwargs)
+
+
+def count_mode_ctx(mode: CountMode) -> Callable[[], AsyncIterator[None]]:
+    async def _count_mode_dependency() -> AsyncIterator[None]:
+        token = _count_mode.set(mode)
+        try:
+            yield
+        finally:
+            _count_mode.reset(token)
+
+    return _count_mode_dependency
+
+
+def count_version_key(table: str) -> str:
+    return f"{COUNT_CACHE_PREFIX}:{table}:version"
+
+
+def default_count_cache() -> ICacheBackend:
+    from config.di import Container
+
+    return Container.cache()
+
+
+async def invalidate_counts(cache: ICacheBackend, *tables: str) -> None:
+    """
+    Сбрасывает закэшированные count(*) запросов к таблицам
+    """
+    await cache.delete(*(count_version_key(table) for table in tables))
+
+
+async def _exact_count(session: AsyncSession, query: Select) -> int:
+    count_query = select(func.count()).select_from(query.order_by(None).subquery())
+    return await session.scalar(count_query) or 0
+
+
+async def _estimated_count(session: AsyncSession, query: Select) -> int:
+    # for an unfiltered scan the planner scales pg_class.reltuples
+    # to the current table size, filters apply column statistics
+    plan = await session.scalar(_Explain(query.order_by(None)))
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def _cached_count(
+    session: AsyncSession, query: Select, cache: ICacheBackend, ttl: int
+) -> int:
+    versions = []
+    for table in sorted({table.name for table in find_tables(query)}):
+        version_key = count_version_key(table)
+        version = await cache.get(version_key)
+        if version is None:
+            version = uuid.uuid4().hex.encode()
+            await cache.set(version_key, version, ttl)
+        versions.append(version)
+
+    compiled = query.compile(dialect=session.get_bind().dialect)
+    digest = hashlib.sha1(str(compiled).encode())
+    digest.update(repr(sorted(compiled.params.items())).encode())
+    for version in versions:
+        digest.update(version)
+    key = f"{COUNT_CACHE_PREFIX}:{digest.hexdigest()}"
+
+    value = await cache.get(key)
+    if value is not None:
+        return int(value)
+    total = await _exact_count(session, query)
+    await cache.set(key, str(total).encode(), ttl)
+    return total
+
+
+async def paginate(
+    session: AsyncSession,
+    query: Select,
+    params: AbstractParams | None = None,
+    *,
+    count_mode: CountMode | None = None,
+    cache: ICacheBackend | None = None,
+    ttl: int = settings.PAGINATION_COUNT_CACHE_TTL,
+) -> Any:
+    """
+    Пагинация по limit/offset с выбором способа подсчета total.
+    По умолчанию режим берется из параметра count_mode роута
+    (utils.routing.APIRouter), для cached используется кэш из контейнера
+    """
+    params, raw_params = verify_params(params, "limit-offset")
+    raw_params = cast(RawParams, raw_params)
+    mode = count_mode or _count_mode.get()
+    page_query = query.limit(raw_params.limit).offset(raw_params.offset)
+
+    total = None
+    if mode == CountMode.WINDOW and raw_params.include_total:
+        rows = (
+            await session.execute(page_query.add_columns(func.count().over()))
+        ).all()
+        items = [row[0] for row in rows]
+        if rows:
+            total = rows[0][-1]
+        elif raw_params.offset:
+            # past the last page there is no row to carry the total
+            total = await _exact_count(session, query)
+        else:
+            total = 0
+        return create_page(items, total=total, params=params)
+
+    items = list((await session.scalars(page_query)).all())
+    if raw_params.include_total:
+        if mode == CountMode.ESTIMATE:
+            total = await _estimated_count(session, query)
+        elif mode == CountMode.CACHED:
+            total = await _cached_count(
+                session, query, cache or default_count_cache(), ttl
+            )
+        else:
+            total = await _exact_count(session, query)
+    return create_page(items, total=total, params=params)
 
 
 def _update_route(route: APIRoute) -> None:
@@ -27,18 +316,23 @@ def _update_route(route: APIRoute) -> None:
     cls = cast(Type[AbstractPage[Any]], route.response_model)
     dep = Depends(pagination_ctx(cls, __page_ctx_dep__=True))
 
-    route.dependencies.append(dep)
-    route.dependant.dependencies.append(
-        get_parameterless_sub_dependant(
-            depends=dep,
-            path=route.path_format,
-        ),
-    )
+    deps = [dep]
+    if route.count_mode is not None:
+        deps.append(Depends(count_mode_ctx(route.count_mode)))
+
+    for dep in deps:
+        route.dependencies.append(dep)
+        route.dependant.dependencies.append(
+            get_parameterless_sub_dependant(
+                depends=dep,
+                path=route.path_format,
+            ),
+        )
 
     route.body_field = get_body_field(dependant=route.dependant, name=route.unique_id)
     route.app = request_response(route.get_route_handler())
 
-    for cls, options in reversed(route.middleware):
+    for cls, options in reversed(route.middleware or ()):
         route.app = cls(app=route.app, **options)
 
 
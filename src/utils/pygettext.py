@@ -50,8 +50,8 @@ translatable strings:
     _("Translatable String")
 
 Python of course has no preprocessor so this doesn't work so well.  Thus,
-pygettext searches only for _() by default, but see the -k/--keyword flag
-below for how to augment this.
+pygettext searches only for _() and gettext_lazy() by default, but see the
+-k/--keyword flag below for how to augment this.
 
  [1] https://www.python.org/workshops/1997-10/proceedings/loewis.html
  [2] https://www.gnu.org/software/gettext/gettext.html
@@ -70,6 +70,14 @@ Options:
     --extract-all
         Extract all strings.
 
+    -c filename
+    --compile=filename
+        Compile the given .mo catalog into a memory-mappable bundle (a
+        sorted hash index followed by a string table) instead of
+        extracting strings.  The bundle is written next to the catalog
+        with the .bundle suffix unless -o/--output is given.  You can
+        have multiple -c flags on the command line.
+
     -d name
     --default-domain=name
         Rename the default output file from messages.pot to name.pot.
@@ -158,10 +166,13 @@ If `inputfile' is -, standard input is read.
 
 import ast
 import getopt
+import gettext
 import glob
+import hashlib
 import importlib.machinery
 import importlib.util
 import os
+import struct
 import sys
 import time
 import token
@@ -169,11 +180,21 @@ import tokenize
 
 __version__ = "1.5"
 
-default_keywords = ["_"]
+default_keywords = ["_", "gettext_lazy"]
 DEFAULTKEYWORDS = ", ".join(default_keywords)
 
 EMPTYSTRING = ""
 
+# Bundle layout (keep in sync with config.i18n.MappedTranslations):
+#   header: magic, version, number of entries
+#   index:  (hash, msgid offset, msgid length, msgstr offset, msgstr length)
+#           per entry, sorted by hash
+#   string table: utf-8 encoded msgids and msgstrs
+BUNDLE_MAGIC = b"I18B"
+BUNDLE_VERSION = 2
+BUNDLE_HEADER = struct.Struct("<4sII")
+BUNDLE_ENTRY = struct.Struct("<QIIII")
+
 
 # The normal pot-file header. msgmerge and Emacs's po-mode work better if it's
 # there.
@@ -313,6 +334,43 @@ def getFilesForName(name):
     return []
 
 
+def bundle_hash(key):
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def compile_bundle(mofile, outfile):
+    with open(mofile, "rb") as fp:
+        catalog = gettext.GNUTranslations(fp)._catalog
+    entries = []
+    for msgid, msgstr in catalog.items():
+        # the metadata entry ("") keeps Plural-Forms for the runtime,
+        # plural forms are stored as "<msgid>\0<index>"
+        if isinstance(msgid, tuple):
+            msgid, index = msgid
+            key = msgid.encode("utf-8") + b"\0" + str(index).encode("ascii")
+        else:
+            key = msgid.encode("utf-8")
+        entries.append((bundle_hash(key), key, msgstr.encode("utf-8")))
+    entries.sort()
+
+    offset = BUNDLE_HEADER.size + BUNDLE_ENTRY.size * len(entries)
+    index = []
+    table = []
+    for keyhash, key, value in entries:
+        index.append(
+            BUNDLE_ENTRY.pack(keyhash, offset, len(key), offset + len(key), len(value))
+        )
+        table.append(key)
+        table.append(value)
+        offset += len(key) + len(value)
+
+    with open(outfile, "wb") as fp:
+        fp.write(BUNDLE_HEADER.pack(BUNDLE_MAGIC, BUNDLE_VERSION, len(entries)))
+        fp.write(b"".join(index))
+        fp.write(b"".join(table))
+    return len(entries)
+
+
 class TokenEater:
     def __init__(self, options):
         self.__options = options
@@ -550,9 +608,10 @@ def main():
     try:
         opts, args = getopt.getopt(
             sys.argv[1:],
-            "ad:DEhk:Kno:p:S:Vvw:x:X:",
+            "ac:d:DEhk:Kno:p:S:Vvw:x:X:",
             [
                 "extract-all",
+                "compile=",
                 "default-domain=",
                 "escape",
                 "help",
@@ -592,6 +651,7 @@ def main():
         excludefilename = ""
         docstrings = 0
         nodocstrings = {}
+        compile = []
 
     options = Options()
     locations = {
@@ -605,6 +665,8 @@ def main():
             usage(0)
         elif opt in ("-a", "--extract-all"):
             options.extractall = 1
+        elif opt in ("-c", "--compile"):
+            options.compile.append(arg)
         elif opt in ("-d", "--default-domain"):
             options.outfile = arg + ".pot"
         elif opt in ("-E", "--escape"):
@@ -650,6 +712,22 @@ def main():
             finally:
                 fp.close()
 
+    # compile catalogs into bundles instead of extracting strings
+    if options.compile:
+        if options.outfile != "messages.pot" and len(options.compile) > 1:
+            usage(1, _("-o/--output can not be used with several catalogs"))
+        for mofile in options.compile:
+            if options.outfile != "messages.pot":
+                outfile = options.outfile
+            else:
+                outfile = os.path.splitext(mofile)[0] + ".bundle"
+            if options.outpath:
+                outfile = os.path.join(options.outpath, os.path.basename(outfile))
+            count = compile_bundle(mofile, outfile)
+            if options.verbose:
+                print(_("Compiled %d messages into %s") % (count, outfile))
+        return
+
     # calculate escapes
     make_escapes(not options.escape)
 
@@ -1,24 +1,264 @@
+import asyncio
+import functools
+import json
 from abc import ABC, abstractmethod
-from typing import Any, Dict, Generic, List, Type, TypeVar
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+)
 
-from pydantic import BaseModel
-from sqlalchemy import Column, Result, Select, delete, select, update
+from fastapi_pagination.bases import AbstractParams
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import (
+    Column,
+    Result,
+    Select,
+    any_,
+    bindparam,
+    delete,
+    event,
+    insert,
+    inspect,
+    select,
+    update,
+)
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, SessionTransaction, make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
 
+from config import settings
 from config.db import Base, Database
+from utils.cache import ICacheBackend
 from utils.decorators import handle_orm_error
+from utils.exceptions import Custom404Exception
+from utils.metrics import metrics
+from utils.pagination import (
+    KeysetParams,
+    column_adapter,
+    count_version_key,
+    paginate,
+    paginate_keyset,
+)
+from utils.routing import CountMode
 from utils.shortcuts import get_object_or_404
 
 TModel = TypeVar("TModel", bound=Base)
 TSchema = TypeVar("TSchema", bound=BaseModel)
 
 
+LOOKUP_CACHE_KEY = "repo_lookup_cache"
+LOOKUP_PARAM = "lookup_value"
+LOADER_KEY = "repo_loader"
+# marks a session whose transaction has written
+WRITES_KEY = "repo_has_writes"
+PENDING_INVALIDATION_KEY = "repo_pending_invalidation"
+# json values are never empty
+NEGATIVE_CACHE_VALUE = b""
+
+entity_cache_requests = metrics.counter(
+    "entity_cache_requests_total", "Entity cache lookups by result."
+)
+_invalidation_tasks: Set[asyncio.Task] = set()
+
+
+def has_writes(session: AsyncSession) -> bool:
+    """
+    Транзакция сессии уже писала в БД (или в сессии есть несохраненные
+    изменения): прочитанные в ней строки могут быть не закоммичены
+    """
+    return bool(
+        session.info.get(WRITES_KEY) or session.new or session.dirty or session.deleted
+    )
+
+
+def invalidate_on_commit(
+    session: AsyncSession, cache: ICacheBackend, *keys: str
+) -> None:
+    """
+    Удаляет ключи из кэша после коммита транзакции сессии:
+    до коммита конкурентный читатель может снова закэшировать старую строку
+    """
+    pending = session.info.setdefault(PENDING_INVALIDATION_KEY, {})
+    pending.setdefault(cache, set()).update(keys)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_writes(session: Session, flush_context: Any) -> None:
+    session.info[WRITES_KEY] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session: Session) -> None:
+    pending = session.info.pop(PENDING_INVALIDATION_KEY, None)
+    if not pending:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # sync Session outside of an event loop (scripts, celery, migrations):
+        # a private loop, asyncio.run would reset the thread's current loop
+        loop = asyncio.new_event_loop()
+        try:
+            for cache, keys in pending.items():
+                loop.run_until_complete(cache.delete(*keys))
+        finally:
+            loop.close()
+        return
+    for cache, keys in pending.items():
+        task = loop.create_task(cache.delete(*keys))
+        _invalidation_tasks.add(task)
+        task.add_done_callback(_invalidation_tasks.discard)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _reset_writes(session: Session, transaction: SessionTransaction) -> None:
+    if transaction.parent is None:
+        session.info.pop(WRITES_KEY, None)
+        session.info.pop(PENDING_INVALIDATION_KEY, None)
+
+
+@functools.lru_cache
+def _list_adapter(schema: Type[TSchema]) -> TypeAdapter[List[TSchema]]:
+    return TypeAdapter(List[schema])  # type: ignore[valid-type]
+
+
+def enable_lookup_cache(session: AsyncSession) -> None:
+    """
+    Включает кэш выборок get_by_id/get_by_field в рамках сессии.
+    Кэш модели (и ее RepoLoader) сбрасывается при любой записи через Repo
+    """
+    session.info.setdefault(LOOKUP_CACHE_KEY, {})
+
+
+class ByIds(Dict[Any, TModel]):
+    def __init__(self, found: Dict[Any, TModel], *, missing: List[Any]) -> None:
+        super().__init__(found)
+        self.missing = missing
+
+
+class RepoLoader(Generic[TModel]):
+    """
+    Собирает вызовы load, сделанные в одной итерации event loop,
+    в один запрос get_by_ids. Пачки загружаются по очереди: сессия
+    не выполняет запросы параллельно. Загруженные объекты кэшируются
+    до записи в модель через Repo
+    """
+
+    def __init__(self, repo: "IRepo[TModel]", session: AsyncSession) -> None:
+        self.repo = repo
+        self.session = session
+        self._futures: Dict[Any, asyncio.Future] = {}
+        self._pending: List[Any] = []
+        # event loop keeps only weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self._lock = asyncio.Lock()
+
+    async def load(self, id_: Any) -> TModel:
+        future = self._futures.get(id_)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[id_] = loop.create_future()
+            if not self._pending:
+                loop.call_soon(self._dispatch)
+            self._pending.append(id_)
+        return await future
+
+    async def load_many(self, ids: List[Any]) -> List[TModel]:
+        return list(await asyncio.gather(*(self.load(id_) for id_ in ids)))
+
+    def clear(self, id_: Any | None = None) -> None:
+        if id_ is None:
+            self._futures = {}
+        else:
+            self._futures.pop(id_, None)
+
+    def _dispatch(self) -> None:
+        ids, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._load(ids))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _load(self, ids: List[Any]) -> None:
+        futures = [self._futures[id_] for id_ in ids]
+        try:
+            async with self._lock:
+                found = await self.repo.get_by_ids(ids, session=self.session)
+        except Exception as e:
+            for id_, future in zip(ids, futures):
+                if self._futures.get(id_) is future:
+                    del self._futures[id_]
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for id_, future in zip(ids, futures):
+            if future.done():
+                continue
+            try:
+                future.set_result(get_object_or_404(found.get(id_)))
+            except Custom404Exception as e:
+                future.set_exception(e)
+
+
 class IRepo(ABC, Generic[TModel]):
     @abstractmethod
     def all_as_select(self) -> Select[TModel]: ...
     @abstractmethod
     async def all(self, *, session: AsyncSession) -> Result[TModel]: ...
     @abstractmethod
+    async def page(
+        self,
+        *,
+        params: AbstractParams | None = None,
+        count_mode: CountMode | None = None,
+        session: AsyncSession,
+    ) -> Any: ...
+    @abstractmethod
+    async def keyset_page(
+        self,
+        order_by: Sequence[str] = (),
+        *,
+        descending: bool = False,
+        params: KeysetParams | None = None,
+        session: AsyncSession,
+    ) -> Any: ...
+    @abstractmethod
+    async def project(
+        self,
+        schema: Type[TSchema] | Sequence[str],
+        field: str | None = None,
+        value: Any = None,
+        *,
+        session: AsyncSession,
+    ) -> List[TSchema] | List[Dict[str, Any]]: ...
+    @abstractmethod
+    def stream(
+        self,
+        field: str | None = None,
+        value: Any = None,
+        *,
+        batch_size: int = 1000,
+        session: AsyncSession,
+    ) -> AsyncIterator[TModel]: ...
+    @abstractmethod
+    def stream_batches(
+        self,
+        field: str | None = None,
+        value: Any = None,
+        *,
+        size: int = 1000,
+        session: AsyncSession,
+    ) -> AsyncIterator[List[TModel]]: ...
+    @abstractmethod
     async def get_by_id(
         self,
         id_: int,
@@ -32,8 +272,20 @@ class IRepo(ABC, Generic[TModel]):
         ids: List[int],
         *,
         for_update: bool = False,
+        strict: bool = False,
+        session: AsyncSession,
+    ) -> "ByIds[TModel]": ...
+    @abstractmethod
+    async def claim_batch(
+        self,
+        filters: Dict[str, Any],
+        limit: int,
+        *,
+        nowait: bool = False,
         session: AsyncSession,
-    ) -> Select[TModel]: ...
+    ) -> List[TModel]: ...
+    @abstractmethod
+    def loader(self, *, session: AsyncSession) -> "RepoLoader[TModel]": ...
     @abstractmethod
     async def get_by_field(
         self,
@@ -52,6 +304,14 @@ class IRepo(ABC, Generic[TModel]):
         session: AsyncSession,
     ) -> bool: ...
     @abstractmethod
+    async def exists_many(
+        self,
+        field: str,
+        values: Iterable[Any],
+        *,
+        session: AsyncSession,
+    ) -> Set[Any]: ...
+    @abstractmethod
     async def create(
         self,
         entry: TSchema,
@@ -59,6 +319,37 @@ class IRepo(ABC, Generic[TModel]):
         session: AsyncSession,
     ) -> TModel: ...
     @abstractmethod
+    async def create_returning(
+        self,
+        entry: TSchema,
+        *,
+        columns: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> TModel | Dict[str, Any]: ...
+    @abstractmethod
+    async def create_many(
+        self,
+        entries: Sequence[TSchema],
+        *,
+        session: AsyncSession,
+    ) -> List[TModel]: ...
+    @abstractmethod
+    async def upsert_many(
+        self,
+        entries: Sequence[TSchema],
+        *,
+        conflict_cols: Sequence[str],
+        update_cols: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> List[TModel]: ...
+    @abstractmethod
+    async def copy_many(
+        self,
+        entries: Sequence[TSchema],
+        *,
+        session: AsyncSession,
+    ) -> int: ...
+    @abstractmethod
     async def update(
         self,
         instance: TModel,
@@ -67,6 +358,15 @@ class IRepo(ABC, Generic[TModel]):
         session: AsyncSession,
     ) -> None: ...
     @abstractmethod
+    async def update_returning(
+        self,
+        instance: TModel,
+        values: Dict,
+        *,
+        columns: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> TModel | Dict[str, Any]: ...
+    @abstractmethod
     async def multi_update(
         self,
         ids: List[int],
@@ -75,6 +375,15 @@ class IRepo(ABC, Generic[TModel]):
         session: AsyncSession,
     ) -> None: ...
     @abstractmethod
+    async def multi_update_returning(
+        self,
+        ids: List[int],
+        *,
+        values: Dict[str, Any],
+        columns: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> List[TModel] | List[Dict[str, Any]]: ...
+    @abstractmethod
     async def delete(
         self,
         instance: TModel,
@@ -92,10 +401,26 @@ class IRepo(ABC, Generic[TModel]):
 
 
 class Repo(IRepo[TModel]):
-    def __init__(self, db: Database, model_class: Type[TModel], pk_field: str) -> None:
+    def __init__(
+        self,
+        db: Database,
+        model_class: Type[TModel],
+        pk_field: str,
+        *,
+        count_cache: ICacheBackend | None = None,
+    ) -> None:
+        """
+        count_cache - кэш total пагинации в режиме cached: page считает
+        total через него, записи сбрасывают total таблицы после коммита
+        """
         self.session_factory = db.session
         self.model_class = model_class
         self.pk_field = pk_field
+        self.count_cache = count_cache
+        self._statements: Dict[Tuple[str, bool], Select[TModel]] = {}
+        self._exists_statements: Dict[str, Select[Tuple[bool]]] = {}
+        # an overridden all_as_select may add filters that change between calls
+        self._reuse_statements = type(self).all_as_select is Repo.all_as_select
 
         assert hasattr(self.model_class, self.pk_field), "Wrong pk_field"
 
@@ -106,10 +431,179 @@ class Repo(IRepo[TModel]):
     def all_as_select(self) -> Select[TModel]:
         return select(self.model_class)
 
+    def _field_select(self, field: str, *, for_update: bool = False) -> Select[TModel]:
+        """
+        Шаблон выборки по полю со значением в bindparam LOOKUP_PARAM.
+        Строится один раз на (field, for_update), поэтому SQLAlchemy
+        не пересобирает конструкцию и не вычисляет заново ключ кэша компиляции.
+        Если all_as_select переопределен, шаблон строится на каждый вызов
+        """
+        key = (field, for_update)
+        qs = self._statements.get(key)
+        if qs is None:
+            qs = self.all_as_select().filter(
+                getattr(self.model_class, field) == bindparam(LOOKUP_PARAM)
+            )
+            if for_update:
+                qs = qs.with_for_update()
+            if self._reuse_statements:
+                self._statements[key] = qs
+        return qs
+
+    def _lookup_cache(self, session: AsyncSession) -> Dict[Tuple, TModel] | None:
+        cache = session.info.get(LOOKUP_CACHE_KEY)
+        if cache is None:
+            return None
+        return cache.setdefault(self.model_class, {})
+
+    def _on_write(self, session: AsyncSession) -> None:
+        session.info[WRITES_KEY] = True
+        self._invalidate_lookup_cache(session)
+        if self.count_cache is not None:
+            invalidate_on_commit(
+                session,
+                self.count_cache,
+                count_version_key(self.model_class.__tablename__),
+            )
+
+    def _invalidate_lookup_cache(self, session: AsyncSession) -> None:
+        cache = session.info.get(LOOKUP_CACHE_KEY)
+        if cache:
+            cache.pop(self.model_class, None)
+        for key, loader in session.info.items():
+            if (
+                isinstance(key, tuple)
+                and key[:1] == (LOADER_KEY,)
+                and loader.repo.model_class is self.model_class
+            ):
+                loader.clear()
+
     @handle_orm_error
     async def all(self, *, session: AsyncSession) -> Result[TModel]:
         return await session.execute(self.all_as_select())
 
+    @handle_orm_error
+    async def page(
+        self,
+        *,
+        params: AbstractParams | None = None,
+        count_mode: CountMode | None = None,
+        session: AsyncSession,
+    ) -> Any:
+        return await paginate(
+            session,
+            self.all_as_select().order_by(self.pk),
+            params,
+            count_mode=count_mode,
+            cache=self.count_cache,
+        )
+
+    @handle_orm_error
+    async def keyset_page(
+        self,
+        order_by: Sequence[str] = (),
+        *,
+        descending: bool = False,
+        params: KeysetParams | None = None,
+        session: AsyncSession,
+    ) -> Any:
+        """
+        Страница all_as_select по курсору, pk добавляется в конец order_by
+        для однозначного порядка
+        """
+        columns = [getattr(self.model_class, field) for field in order_by]
+        if self.pk_field not in order_by:
+            columns.append(self.pk)
+        return await paginate_keyset(
+            session,
+            self.all_as_select(),
+            columns,
+            descending=descending,
+            params=params,
+        )
+
+    def _projected_select(self, schema: Type[TSchema] | Sequence[str]) -> Select:
+        if isinstance(schema, type) and issubclass(schema, BaseModel):
+            # with from_attributes the alias names the source attribute
+            names = [info.alias or name for name, info in schema.model_fields.items()]
+        else:
+            names = list(schema)
+        for name in names:
+            assert hasattr(self.model_class, name), f"Wrong field {name}"
+        return self.all_as_select().with_only_columns(
+            *(getattr(self.model_class, name).label(name) for name in names)
+        )
+
+    @handle_orm_error
+    async def project(
+        self,
+        schema: Type[TSchema] | Sequence[str],
+        field: str | None = None,
+        value: Any = None,
+        *,
+        session: AsyncSession,
+    ) -> List[TSchema] | List[Dict[str, Any]]:
+        """
+        Выбирает только колонки схемы (или перечисленные колонки) и
+        валидирует строки в схему одним вызовом, без создания ORM объектов.
+        Для списка колонок возвращает словари
+        """
+        qs = self._projected_select(schema)
+        if field is not None:
+            qs = qs.filter(getattr(self.model_class, field) == value)
+        result = await session.execute(qs)
+        if isinstance(schema, type) and issubclass(schema, BaseModel):
+            return _list_adapter(schema).validate_python(
+                result.all(), from_attributes=True
+            )
+        return [dict(row) for row in result.mappings()]
+
+    def _stream_select(
+        self, field: str | None, value: Any, batch_size: int
+    ) -> Select[TModel]:
+        qs = self.all_as_select()
+        if field is not None:
+            qs = qs.filter(getattr(self.model_class, field) == value)
+        # server-side cursor, rows are fetched from it by batch_size
+        return qs.execution_options(stream_results=True, yield_per=batch_size)
+
+    async def stream(
+        self,
+        field: str | None = None,
+        value: Any = None,
+        *,
+        batch_size: int = 1000,
+        session: AsyncSession,
+    ) -> AsyncIterator[TModel]:
+        """
+        Результат закрывается при закрытии генератора: если перебор может
+        прерваться раньше, используйте contextlib.aclosing.
+        Серверный курсор asyncpg (портал) закрывается вместе с транзакцией
+        """
+        result = await session.stream_scalars(
+            self._stream_select(field, value, batch_size)
+        )
+        try:
+            async for instance in result:
+                yield instance
+        finally:
+            await result.close()
+
+    async def stream_batches(
+        self,
+        field: str | None = None,
+        value: Any = None,
+        *,
+        size: int = 1000,
+        session: AsyncSession,
+    ) -> AsyncIterator[List[TModel]]:
+        result = await session.stream_scalars(self._stream_select(field, value, size))
+        try:
+            async for partition in result.partitions(size):
+                yield list(partition)
+        finally:
+            await result.close()
+
     @handle_orm_error
     async def get_by_id(
         self,
@@ -118,12 +612,19 @@ class Repo(IRepo[TModel]):
         for_update: bool = False,
         session: AsyncSession,
     ) -> TModel:
-        qs = self.all_as_select().filter(self.pk == id_)
-        if for_update:
-            qs = qs.with_for_update()
-        result = await session.execute(qs)
+        cache = self._lookup_cache(session)
+        key = (self.pk_field, id_)
+        if cache is not None and not for_update and key in cache:
+            return cache[key]
+        result = await session.execute(
+            self._field_select(self.pk_field, for_update=for_update),
+            {LOOKUP_PARAM: id_},
+        )
         first = result.first()
-        return get_object_or_404(first[0] if first else None)
+        instance = get_object_or_404(first[0] if first else None)
+        if cache is not None:
+            cache[key] = instance
+        return instance
 
     @handle_orm_error
     async def get_by_ids(
@@ -131,14 +632,69 @@ class Repo(IRepo[TModel]):
         ids: List[int],
         *,
         for_update: bool = False,
+        strict: bool = False,
         session: AsyncSession,
-    ) -> Select[TModel]:
-        qs = self.all_as_select().filter(self.pk.in_(ids))
-        if for_update:
-            qs = qs.with_for_update()
-        result = await session.execute(qs)
-        first = result.first()
-        return get_object_or_404(first[0] if first else None)
+    ) -> "ByIds[TModel]":
+        """
+        Возвращает словарь id -> объект в порядке ids,
+        ненайденные id перечислены в missing.
+        strict=True - 404, если хотя бы один id не найден
+        """
+        found: Dict[Any, TModel] = {}
+        if ids:
+            qs = self.all_as_select().filter(self.pk.in_(ids))
+            if for_update:
+                qs = qs.with_for_update()
+            result = await session.scalars(qs)
+            found = {getattr(instance, self.pk_field): instance for instance in result}
+        by_ids = ByIds(
+            {id_: found[id_] for id_ in ids if id_ in found},
+            missing=[id_ for id_ in dict.fromkeys(ids) if id_ not in found],
+        )
+        if strict and by_ids.missing:
+            get_object_or_404(None)
+        return by_ids
+
+    @handle_orm_error
+    async def claim_batch(
+        self,
+        filters: Dict[str, Any],
+        limit: int,
+        *,
+        nowait: bool = False,
+        session: AsyncSession,
+    ) -> List[TModel]:
+        """
+        Блокирует до limit записей по filters (поле -> значение) в порядке pk.
+        Записи, заблокированные другими транзакциями, пропускаются
+        (FOR UPDATE SKIP LOCKED), поэтому параллельные воркеры получают
+        непересекающиеся пачки. nowait=True - вместо пропуска ошибка
+        блокировки (FOR UPDATE NOWAIT).
+        Блокировки держатся до конца транзакции сессии
+        """
+        qs = (
+            self.all_as_select()
+            .filter(
+                *(
+                    getattr(self.model_class, field) == value
+                    for field, value in filters.items()
+                )
+            )
+            .order_by(self.pk)
+            .limit(limit)
+            .with_for_update(skip_locked=not nowait, nowait=nowait)
+            .execution_options(populate_existing=True)
+        )
+        return list((await session.scalars(qs)).all())
+
+    def loader(self, *, session: AsyncSession) -> "RepoLoader[TModel]":
+        """
+        Загрузчик, общий для всех вызовов в рамках сессии (запроса)
+        """
+        key = (LOADER_KEY, self)
+        if key not in session.info:
+            session.info[key] = RepoLoader(self, session)
+        return session.info[key]
 
     @handle_orm_error
     async def get_by_field(
@@ -149,24 +705,59 @@ class Repo(IRepo[TModel]):
         for_update: bool = False,
         session: AsyncSession,
     ) -> TModel:
-        qs = self.all_as_select().filter(getattr(self.model_class, field) == value)
-        if for_update:
-            qs = qs.with_for_update()
-        result = await session.execute(qs)
+        cache = self._lookup_cache(session)
+        key = (field, value)
+        if cache is not None and not for_update and key in cache:
+            return cache[key]
+        result = await session.execute(
+            self._field_select(field, for_update=for_update), {LOOKUP_PARAM: value}
+        )
         first = result.first()
-        return get_object_or_404(first[0] if first else None)
+        instance = get_object_or_404(first[0] if first else None)
+        if cache is not None:
+            cache[key] = instance
+            cache[(self.pk_field, getattr(instance, self.pk_field))] = instance
+        return instance
 
     @handle_orm_error
     async def exists_by_field(
         self, field: str, value: Any, *, session: AsyncSession
     ) -> bool:
+        qs = self._exists_statements.get(field)
+        if qs is None:
+            qs = select(self._field_select(field).exists())
+            if self._reuse_statements:
+                self._exists_statements[field] = qs
+        return bool(await session.scalar(qs, {LOOKUP_PARAM: value}))
+
+    @handle_orm_error
+    async def exists_many(
+        self,
+        field: str,
+        values: Iterable[Any],
+        *,
+        session: AsyncSession,
+    ) -> Set[Any]:
+        """
+        Возвращает множество значений field из values, которые есть в таблице.
+        Значения передаются одним параметром-массивом (= ANY), поэтому запрос
+        один при любом размере values
+        """
+        values = list(dict.fromkeys(values))
+        if not values:
+            return set()
+        column = getattr(self.model_class, field)
         qs = (
             self.all_as_select()
-            .filter(getattr(self.model_class, field) == value)
-            .limit(1)
+            .with_only_columns(column)
+            .filter(
+                column
+                == any_(bindparam(LOOKUP_PARAM, type_=postgresql.ARRAY(column.type)))
+            )
+            .distinct()
         )
-        result = await session.execute(qs)
-        return result.first() is not None
+        result = await session.scalars(qs, {LOOKUP_PARAM: values})
+        return set(result)
 
     @handle_orm_error
     async def create(
@@ -175,12 +766,138 @@ class Repo(IRepo[TModel]):
         *,
         session: AsyncSession,
     ) -> TModel:
+        self._on_write(session)
         instance = self.model_class(**entry.model_dump())
         session.add(instance)
         await session.flush([instance])
         await session.refresh(instance)
         return instance
 
+    def _returning(self, columns: Sequence[str] | None) -> List[Any]:
+        if not columns:
+            return [self.model_class]
+        return [getattr(self.model_class, column) for column in columns]
+
+    async def _execute_returning(
+        self, qs: Any, columns: Sequence[str] | None, session: AsyncSession
+    ) -> List[TModel] | List[Dict[str, Any]]:
+        if not columns:
+            qs = qs.execution_options(populate_existing=True)
+            return list((await session.scalars(qs)).all())
+        return [dict(row) for row in (await session.execute(qs)).mappings()]
+
+    @handle_orm_error
+    async def create_returning(
+        self,
+        entry: TSchema,
+        *,
+        columns: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> TModel | Dict[str, Any]:
+        """
+        INSERT ... RETURNING: запись (или колонки columns) возвращается
+        тем же запросом, без flush и refresh
+        """
+        self._on_write(session)
+        qs = (
+            insert(self.model_class)
+            .values(**entry.model_dump())
+            .returning(*self._returning(columns))
+        )
+        return (await self._execute_returning(qs, columns, session))[0]
+
+    @handle_orm_error
+    async def create_many(
+        self,
+        entries: Sequence[TSchema],
+        *,
+        session: AsyncSession,
+    ) -> List[TModel]:
+        """
+        Один multi-row INSERT ... RETURNING вместо вставки и refresh на каждую запись
+        """
+        self._on_write(session)
+        if not entries:
+            return []
+        result = await session.scalars(
+            insert(self.model_class).returning(
+                self.model_class, sort_by_parameter_order=True
+            ),
+            [entry.model_dump() for entry in entries],
+        )
+        return list(result.all())
+
+    @handle_orm_error
+    async def upsert_many(
+        self,
+        entries: Sequence[TSchema],
+        *,
+        conflict_cols: Sequence[str],
+        update_cols: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> List[TModel]:
+        """
+        INSERT ... ON CONFLICT (conflict_cols) DO UPDATE.
+        По умолчанию обновляются все переданные поля, кроме conflict_cols
+        """
+        self._on_write(session)
+        if not entries:
+            return []
+        rows = [entry.model_dump() for entry in entries]
+        if update_cols is None:
+            update_cols = [
+                col
+                for col in rows[0].keys()
+                if col not in conflict_cols and col != self.pk_field
+            ]
+        qs = postgresql.insert(self.model_class)
+        if update_cols:
+            qs = qs.on_conflict_do_update(
+                index_elements=list(conflict_cols),
+                set_={col: qs.excluded[col] for col in update_cols},
+            )
+        else:
+            qs = qs.on_conflict_do_nothing(index_elements=list(conflict_cols))
+        result = await session.scalars(
+            qs.returning(self.model_class, sort_by_parameter_order=True),
+            rows,
+            execution_options={"populate_existing": True},
+        )
+        return list(result.all())
+
+    @handle_orm_error
+    async def copy_many(
+        self,
+        entries: Sequence[TSchema],
+        *,
+        session: AsyncSession,
+    ) -> int:
+        """
+        Вставка через COPY (asyncpg copy_records_to_table) для очень больших пачек.
+        Значения по умолчанию на стороне python не применяются,
+        созданные записи не возвращаются
+        """
+        self._on_write(session)
+        if not entries:
+            return 0
+        rows = [entry.model_dump() for entry in entries]
+        columns = list(rows[0].keys())
+        table = self.model_class.__table__
+        connection = await session.connection()
+        raw_connection = await connection.get_raw_connection()
+        driver_connection = raw_connection.driver_connection
+        if not driver_connection.is_in_transaction():
+            # the asyncpg adapter sends BEGIN only with the first statement,
+            # otherwise COPY runs in autocommit and survives a rollback
+            await connection.exec_driver_sql("SELECT 1")
+        await driver_connection.copy_records_to_table(
+            table.name,
+            records=[tuple(row[col] for col in columns) for row in rows],
+            columns=columns,
+            schema_name=table.schema,
+        )
+        return len(rows)
+
     @handle_orm_error
     async def update(
         self,
@@ -189,12 +906,36 @@ class Repo(IRepo[TModel]):
         *,
         session: AsyncSession,
     ) -> None:
+        self._on_write(session)
         await session.execute(
             update(self.model_class)
             .filter(self.pk == getattr(instance, self.pk_field))
             .values(**values)
         )
 
+    @handle_orm_error
+    async def update_returning(
+        self,
+        instance: TModel,
+        values: Dict,
+        *,
+        columns: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> TModel | Dict[str, Any]:
+        """
+        UPDATE ... RETURNING: обновленная запись (или колонки columns)
+        без повторного SELECT
+        """
+        self._on_write(session)
+        qs = (
+            update(self.model_class)
+            .filter(self.pk == getattr(instance, self.pk_field))
+            .values(**values)
+            .returning(*self._returning(columns))
+        )
+        rows = await self._execute_returning(qs, columns, session)
+        return get_object_or_404(rows[0] if rows else None)
+
     @handle_orm_error
     async def multi_update(
         self,
@@ -203,10 +944,31 @@ class Repo(IRepo[TModel]):
         values: Dict[str, Any],
         session: AsyncSession,
     ) -> None:
+        self._on_write(session)
         await session.execute(
             update(self.model_class).filter(self.pk.in_(ids)).values(**values)
         )
 
+    @handle_orm_error
+    async def multi_update_returning(
+        self,
+        ids: List[int],
+        *,
+        values: Dict[str, Any],
+        columns: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> List[TModel] | List[Dict[str, Any]]:
+        self._on_write(session)
+        if not ids:
+            return []
+        qs = (
+            update(self.model_class)
+            .filter(self.pk.in_(ids))
+            .values(**values)
+            .returning(*self._returning(columns))
+        )
+        return await self._execute_returning(qs, columns, session)
+
     @handle_orm_error
     async def delete(
         self,
@@ -214,6 +976,7 @@ class Repo(IRepo[TModel]):
         *,
         session: AsyncSession,
     ) -> None:
+        self._on_write(session)
         await session.execute(
             delete(self.model_class).filter(self.pk == getattr(instance, self.pk_field))
         )
@@ -226,6 +989,318 @@ class Repo(IRepo[TModel]):
         *,
         session: AsyncSession,
     ) -> None:
+        self._on_write(session)
         await session.execute(
             delete(self.model_class).filter(getattr(self.model_class, field) == value)
         )
+
+
+class CachedRepo(Repo[TModel]):
+    """
+    Репозиторий с read-through кэшем get_by_id/get_by_field.
+    Строки хранятся по ключу первичного ключа, выборки по полю хранят
+    первичный ключ, 404 кэшируются на negative_ttl.
+    Ключи сбрасываются при записи и повторно после коммита транзакции,
+    вместе с ними сбрасывается total пагинации в режиме cached.
+    Сессия, которая уже писала, читает только из БД и не пишет в кэш
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        model_class: Type[TModel],
+        pk_field: str,
+        *,
+        cache: ICacheBackend,
+        ttl: int = settings.ENTITY_CACHE_TTL,
+        negative_ttl: int = settings.ENTITY_CACHE_NEGATIVE_TTL,
+        prefix: str = "entity",
+    ) -> None:
+        super().__init__(db, model_class, pk_field, count_cache=cache)
+        self.cache = cache
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.prefix = prefix
+        self._mapper = inspect(model_class)
+        self._adapters = {
+            attr.key: column_adapter(attr.columns[0])
+            for attr in self._mapper.column_attrs
+        }
+        self._columns = list(self._adapters)
+
+    def _key(self, field: str, value: Any) -> str:
+        return f"{self.prefix}:{self.model_class.__tablename__}:{field}:{value}"
+
+    def _dump(self, instance: TModel) -> bytes:
+        return json.dumps(
+            {
+                col: adapter.dump_python(getattr(instance, col), mode="json")
+                for col, adapter in self._adapters.items()
+            }
+        ).encode()
+
+    def _parse(self, data: bytes) -> Dict[str, Any] | None:
+        try:
+            row = json.loads(data)
+            return {
+                col: adapter.validate_python(row[col])
+                for col, adapter in self._adapters.items()
+            }
+        except (ValueError, KeyError, TypeError):
+            # written by another version of the model
+            return None
+
+    def _dump_pk(self, pk: Any) -> bytes:
+        return json.dumps(
+            self._adapters[self.pk_field].dump_python(pk, mode="json")
+        ).encode()
+
+    def _parse_pk(self, data: bytes) -> Any:
+        try:
+            return self._adapters[self.pk_field].validate_python(json.loads(data))
+        except ValueError:
+            return None
+
+    async def _load(self, row: Dict[str, Any], session: AsyncSession) -> TModel:
+        instance = self._mapper.class_manager.new_instance()
+        for col, value in row.items():
+            set_committed_value(instance, col, value)
+        make_transient_to_detached(instance)
+        return await session.merge(instance, load=False)
+
+    def _remember(self, session: AsyncSession, instance: TModel, *keys: Tuple) -> None:
+        lookup_cache = self._lookup_cache(session)
+        if lookup_cache is not None:
+            lookup_cache[(self.pk_field, getattr(instance, self.pk_field))] = instance
+            lookup_cache.update((key, instance) for key in keys)
+
+    def _count(self, result: str) -> None:
+        entity_cache_requests.inc(model=self.model_class.__name__, result=result)
+
+    async def _invalidate(
+        self,
+        instances: Sequence[TModel | Dict[str, Any]],
+        session: AsyncSession,
+    ) -> None:
+        keys = set()
+        for instance in instances:
+            row = instance if isinstance(instance, dict) else vars(instance)
+            keys.update(self._key(col, row[col]) for col in self._columns if col in row)
+        keys.add(count_version_key(self.model_class.__tablename__))
+        await self.cache.delete(*keys)
+        invalidate_on_commit(session, self.cache, *keys)
+
+    async def get_by_id(
+        self,
+        id_: int,
+        *,
+        for_update: bool = False,
+        session: AsyncSession,
+    ) -> TModel:
+        lookup_cache = self._lookup_cache(session) or {}
+        if for_update or (self.pk_field, id_) in lookup_cache or has_writes(session):
+            return await super().get_by_id(id_, for_update=for_update, session=session)
+
+        key = self._key(self.pk_field, id_)
+        data = await self.cache.get(key)
+        if data == NEGATIVE_CACHE_VALUE:
+            self._count("negative")
+            return get_object_or_404(None)
+        row = self._parse(data) if data is not None else None
+        if row is not None:
+            self._count("hit")
+            instance = await self._load(row, session)
+            self._remember(session, instance)
+            return instance
+
+        self._count("miss")
+        try:
+            instance = await super().get_by_id(id_, session=session)
+        except Custom404Exception:
+            await self.cache.set(key, NEGATIVE_CACHE_VALUE, self.negative_ttl)
+            raise
+        await self.cache.set(key, self._dump(instance), self.ttl)
+        self._remember(session, instance)
+        return instance
+
+    async def get_by_field(
+        self,
+        field: str,
+        value: Any,
+        *,
+        for_update: bool = False,
+        session: AsyncSession,
+    ) -> TModel:
+        if field == self.pk_field:
+            return await self.get_by_id(value, for_update=for_update, session=session)
+        lookup_cache = self._lookup_cache(session) or {}
+        if for_update or (field, value) in lookup_cache or has_writes(session):
+            return await super().get_by_field(
+                field, value, for_update=for_update, session=session
+            )
+
+        key = self._key(field, value)
+        data = await self.cache.get(key)
+        if data == NEGATIVE_CACHE_VALUE:
+            self._count("negative")
+            return get_object_or_404(None)
+        pk = self._parse_pk(data) if data is not None else None
+        if pk is not None:
+            row_data = await self.cache.get(self._key(self.pk_field, pk))
+            row = self._parse(row_data) if row_data else None
+            # the field may have been changed since the key was cached
+            if row is not None and row.get(field) == value:
+                self._count("hit")
+                instance = await self._load(row, session)
+                self._remember(session, instance, (field, value))
+                return instance
+
+        self._count("miss")
+        try:
+            instance = await super().get_by_field(field, value, session=session)
+        except Custom404Exception:
+            await self.cache.set(key, NEGATIVE_CACHE_VALUE, self.negative_ttl)
+            raise
+        pk = getattr(instance, self.pk_field)
+        await self.cache.set(key, self._dump_pk(pk), self.ttl)
+        await self.cache.set(
+            self._key(self.pk_field, pk), self._dump(instance), self.ttl
+        )
+        self._remember(session, instance, (field, value))
+        return instance
+
+    async def create(self, entry: TSchema, *, session: AsyncSession) -> TModel:
+        instance = await super().create(entry, session=session)
+        await self._invalidate([instance], session)
+        return instance
+
+    async def create_returning(
+        self,
+        entry: TSchema,
+        *,
+        columns: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> TModel | Dict[str, Any]:
+        row = await super().create_returning(entry, columns=columns, session=session)
+        await self._invalidate([row, entry.model_dump()], session)
+        return row
+
+    async def create_many(
+        self,
+        entries: Sequence[TSchema],
+        *,
+        session: AsyncSession,
+    ) -> List[TModel]:
+        instances = await super().create_many(entries, session=session)
+        await self._invalidate(instances, session)
+        return instances
+
+    async def upsert_many(
+        self,
+        entries: Sequence[TSchema],
+        *,
+        conflict_cols: Sequence[str],
+        update_cols: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> List[TModel]:
+        instances = await super().upsert_many(
+            entries,
+            conflict_cols=conflict_cols,
+            update_cols=update_cols,
+            session=session,
+        )
+        await self._invalidate(instances, session)
+        return instances
+
+    async def copy_many(
+        self,
+        entries: Sequence[TSchema],
+        *,
+        session: AsyncSession,
+    ) -> int:
+        count = await super().copy_many(entries, session=session)
+        await self._invalidate([entry.model_dump() for entry in entries], session)
+        return count
+
+    async def update(
+        self,
+        instance: TModel,
+        values: Dict,
+        *,
+        session: AsyncSession,
+    ) -> None:
+        await super().update(instance, values, session=session)
+        await self._invalidate(
+            [{self.pk_field: getattr(instance, self.pk_field)}, values], session
+        )
+
+    async def multi_update(
+        self,
+        ids: List[int],
+        *,
+        values: Dict[str, Any],
+        session: AsyncSession,
+    ) -> None:
+        await super().multi_update(ids, values=values, session=session)
+        await self._invalidate(
+            [{self.pk_field: id_} for id_ in ids] + [values], session
+        )
+
+    async def update_returning(
+        self,
+        instance: TModel,
+        values: Dict,
+        *,
+        columns: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> TModel | Dict[str, Any]:
+        row = await super().update_returning(
+            instance, values, columns=columns, session=session
+        )
+        await self._invalidate(
+            [{self.pk_field: getattr(instance, self.pk_field)}, values], session
+        )
+        return row
+
+    async def multi_update_returning(
+        self,
+        ids: List[int],
+        *,
+        values: Dict[str, Any],
+        columns: Sequence[str] | None = None,
+        session: AsyncSession,
+    ) -> List[TModel] | List[Dict[str, Any]]:
+        rows = await super().multi_update_returning(
+            ids, values=values, columns=columns, session=session
+        )
+        await self._invalidate(
+            [{self.pk_field: id_} for id_ in ids] + [values], session
+        )
+        return rows
+
+    async def delete(
+        self,
+        instance: TModel,
+        *,
+        session: AsyncSession,
+    ) -> None:
+        await super().delete(instance, session=session)
+        await self._invalidate(
+            [{self.pk_field: getattr(instance, self.pk_field)}], session
+        )
+
+    @handle_orm_error
+    async def delete_by_field(
+        self,
+        field: str,
+        value: Any,
+        *,
+        session: AsyncSession,
+    ) -> None:
+        self._on_write(session)
+        result = await session.scalars(
+            delete(self.model_class)
+            .filter(getattr(self.model_class, field) == value)
+            .returning(self.pk)
+        )
+        await self._invalidate([{self.pk_field: pk} for pk in result.all()], session)
@@ -0,0 +1,28 @@
+import json
+from typing import Any
+
+from starlette.responses import JSONResponse as _JSONResponse
+
+from config.i18n import LazyString
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, LazyString):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class JSONResponse(_JSONResponse):
+    """
+    JSONResponse, который переводит LazyString на язык текущего запроса
+    """
+
+    def render(self, content: Any) -> bytes:
+        return json.dumps(
+            content,
+            ensure_ascii=False,
+            allow_nan=False,
+            indent=None,
+            separators=(",", ":"),
+            default=_default,
+        ).encode("utf-8")
@@ -1,25 +1,45 @@
 from enum import Enum
-from typing import Any, Callable, Dict, List, Sequence, Set
+from typing import Any, Callable, Coroutine, Dict, List, Sequence, Set
 
 from fastapi import Depends, params, FastAPI
 from fastapi.datastructures import Default, DefaultPlaceholder
 from fastapi.exceptions import FastAPIError
-from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute as _APIRoute
 from fastapi.routing import APIRouter as _APIRouter
 from fastapi.routing import APIWebSocketRoute
 from fastapi.types import DecoratedCallable, IncEx
 from fastapi.utils import generate_unique_id, get_value_or_default
 from starlette.middleware import Middleware
-from starlette.responses import JSONResponse, Response
+from starlette.requests import Request
+from starlette.responses import Response
 from starlette.routing import BaseRoute, Route, WebSocketRoute
 from starlette.types import ASGIApp, Lifespan
 
+from config.db import activate_timeouts, deactivate_timeouts
+from utils.responses import JSONResponse
 from utils.schemas import default_responses
 
 
+class CountMode(str, Enum):
+    """
+    Способ подсчета total для пагинации (utils.pagination.paginate):
+    exact - отдельный count(*),
+    estimate - оценка планировщика,
+    cached - count(*), закэшированный на TTL,
+    window - count(*) OVER() в запросе страницы
+    """
+
+    EXACT = "exact"
+    ESTIMATE = "estimate"
+    CACHED = "cached"
+    WINDOW = "window"
+
+
 class APIRoute(_APIRoute):
     middleware: Sequence[Middleware] | None = None
+    count_mode: CountMode | None = None
+    statement_timeout: float | None = None
+    lock_timeout: float | None = None
 
     def __init__(
         self,
@@ -53,12 +73,18 @@ class APIRoute(_APIRoute):
             Callable[[_APIRoute], str] | DefaultPlaceholder
         ) = Default(generate_unique_id),
         middleware: Sequence[Middleware] | None = None,
+        count_mode: CountMode | None = None,
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
     ) -> None:
         if responses is None:
             responses = default_responses
         else:
             for status, response in default_responses.items():
                 responses.setdefault(status, response)
+        # used by get_route_handler, which is called from the base __init__
+        self.statement_timeout = statement_timeout
+        self.lock_timeout = lock_timeout
         super().__init__(
             path,
             endpoint,
@@ -88,11 +114,26 @@ class APIRoute(_APIRoute):
             generate_unique_id_function=generate_unique_id_function,
         )
 
+        self.count_mode = count_mode
         if middleware is not None:
             self.middleware = middleware
             for cls, options in reversed(middleware):
                 self.app: FastAPI = cls(app=self.app, **options)
 
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+        if self.statement_timeout is None and self.lock_timeout is None:
+            return handler
+
+        async def app(request: Request) -> Response:
+            token = activate_timeouts(self.statement_timeout, self.lock_timeout)
+            try:
+                return await handler(request)
+            finally:
+                deactivate_timeouts(token)
+
+        return app
+
 
 class APIRouter(_APIRouter):
     def __init__(
@@ -117,6 +158,8 @@ class APIRouter(_APIRouter):
         generate_unique_id_function: Callable[[_APIRoute], str] = Default(
             generate_unique_id
         ),
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
     ) -> None:
         assert issubclass(
             route_class, APIRoute
@@ -145,6 +188,8 @@ class APIRouter(_APIRouter):
             include_in_schema=include_in_schema,
             generate_unique_id_function=generate_unique_id_function,
         )
+        self.statement_timeout = statement_timeout
+        self.lock_timeout = lock_timeout
 
     def add_api_route(
         self,
@@ -178,6 +223,9 @@ class APIRouter(_APIRouter):
             Callable[[_APIRoute], str] | DefaultPlaceholder
         ) = Default(generate_unique_id),
         middleware: Sequence[Middleware] | None = None,
+        count_mode: CountMode | None = None,
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
     ) -> None:
         route_class = route_class_override or self.route_class
         responses = responses or {}
@@ -225,6 +273,15 @@ class APIRouter(_APIRouter):
             openapi_extra=openapi_extra,
             generate_unique_id_function=current_generate_unique_id,
             middleware=middleware,
+            count_mode=count_mode,
+            statement_timeout=(
+                statement_timeout
+                if statement_timeout is not None
+                else self.statement_timeout
+            ),
+            lock_timeout=(
+                lock_timeout if lock_timeout is not None else self.lock_timeout
+            ),
         )
         self.routes.append(route)
 
@@ -258,6 +315,9 @@ class APIRouter(_APIRouter):
             generate_unique_id
         ),
         middleware: Sequence[Middleware] | None = None,
+        count_mode: CountMode | None = None,
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
     ) -> Callable[[DecoratedCallable], DecoratedCallable]:
         def decorator(func: DecoratedCallable) -> DecoratedCallable:
             self.add_api_route(
@@ -287,6 +347,9 @@ class APIRouter(_APIRouter):
                 openapi_extra=openapi_extra,
                 generate_unique_id_function=generate_unique_id_function,
                 middleware=middleware,
+                count_mode=count_mode,
+                statement_timeout=statement_timeout,
+                lock_timeout=lock_timeout,
             )
             return func
 
@@ -321,6 +384,9 @@ class APIRouter(_APIRouter):
             generate_unique_id
         ),
         middleware: Sequence[Middleware] | None = None,
+        count_mode: CountMode | None = None,
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
     ) -> Callable[[DecoratedCallable], DecoratedCallable]:
         return self.api_route(
             path=path,
@@ -348,6 +414,9 @@ class APIRouter(_APIRouter):
             openapi_extra=openapi_extra,
             generate_unique_id_function=generate_unique_id_function,
             middleware=middleware,
+            count_mode=count_mode,
+            statement_timeout=statement_timeout,
+            lock_timeout=lock_timeout,
         )
 
     def post(
@@ -379,6 +448,9 @@ class APIRouter(_APIRouter):
             generate_unique_id
         ),
         middleware: Sequence[Middleware] | None = None,
+        count_mode: CountMode | None = None,
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
     ) -> Callable[[DecoratedCallable], DecoratedCallable]:
         return self.api_route(
             path=path,
@@ -406,6 +478,9 @@ class APIRouter(_APIRouter):
             openapi_extra=openapi_extra,
             generate_unique_id_function=generate_unique_id_function,
             middleware=middleware,
+            count_mode=count_mode,
+            statement_timeout=statement_timeout,
+            lock_timeout=lock_timeout,
         )
 
     def patch(
@@ -437,6 +512,9 @@ class APIRouter(_APIRouter):
             generate_unique_id
         ),
         middleware: Sequence[Middleware] | None = None,
+        count_mode: CountMode | None = None,
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
     ) -> Callable[[DecoratedCallable], DecoratedCallable]:
         return self.api_route(
             path=path,
@@ -464,6 +542,9 @@ class APIRouter(_APIRouter):
             openapi_extra=openapi_extra,
             generate_unique_id_function=generate_unique_id_function,
             middleware=middleware,
+            count_mode=count_mode,
+            statement_timeout=statement_timeout,
+            lock_timeout=lock_timeout,
         )
 
     def put(
@@ -495,6 +576,9 @@ class APIRouter(_APIRouter):
             generate_unique_id
         ),
         middleware: Sequence[Middleware] | None = None,
+        count_mode: CountMode | None = None,
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
     ) -> Callable[[DecoratedCallable], DecoratedCallable]:
         return self.api_route(
             path=path,
@@ -522,6 +606,9 @@ class APIRouter(_APIRouter):
             openapi_extra=openapi_extra,
             generate_unique_id_function=generate_unique_id_function,
             middleware=middleware,
+            count_mode=count_mode,
+            statement_timeout=statement_timeout,
+            lock_timeout=lock_timeout,
         )
 
     def delete(
@@ -553,6 +640,9 @@ class APIRouter(_APIRouter):
             generate_unique_id
         ),
         middleware: Sequence[Middleware] | None = None,
+        count_mode: CountMode | None = None,
+        statement_timeout: float | None = None,
+        lock_timeout: float | None = None,
     ) -> Callable[[DecoratedCallable], DecoratedCallable]:
         return self.api_route(
             path=path,
@@ -580,6 +670,9 @@ class APIRouter(_APIRouter):
             openapi_extra=openapi_extra,
             generate_unique_id_function=generate_unique_id_function,
             middleware=middleware,
+            count_mode=count_mode,
+            statement_timeout=statement_timeout,
+            lock_timeout=lock_timeout,
         )
 
     def include_router(
@@ -671,6 +764,9 @@ class APIRouter(_APIRouter):
                     openapi_extra=route.openapi_extra,
                     generate_unique_id_function=current_generate_unique_id,
                     middleware=getattr(route, "middleware", None),
+                    count_mode=getattr(route, "count_mode", None),
+                    statement_timeout=getattr(route, "statement_timeout", None),
+                    lock_timeout=getattr(route, "lock_timeout", None),
                 )
             elif isinstance(route, Route):
                 methods = list(route.methods or [])
@@ -1,9 +1,10 @@
-from config.i18n import _
+from config.i18n import LazyString, gettext_lazy
 from utils.exceptions import Custom404Exception
 
+NOT_FOUND_MESSAGE = gettext_lazy("Not found.")
 
-def get_object_or_404(obj: object | None, *, msg: str | None = None):
-    msg = _(msg) if msg else _("Not found.")
+
+def get_object_or_404(obj: object | None, *, msg: str | LazyString | None = None):
     if obj is None:
-        raise Custom404Exception(msg)
+        raise Custom404Exception(gettext_lazy(msg) if msg else NOT_FOUND_MESSAGE)
     return obj
@@ -0,0 +1,131 @@
+import hashlib
+import os
+from pathlib import Path
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import URL, create_engine, make_url, text
+from sqlalchemy.pool import NullPool
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+MIGRATIONS_DIR = BASE_DIR / "migrations"
+# arbitrary key of the advisory lock held while the template is (re)built
+TEMPLATE_LOCK_KEY = 745_120_391
+
+
+class TemplateDatabase:
+    """
+    Тестовая БД для воркера pytest, клонированная из шаблонной БД.
+    Миграции применяются к шаблону только если изменились файлы миграций,
+    каждый воркер (pytest-xdist) получает свою копию через
+    CREATE DATABASE ... TEMPLATE
+    """
+
+    def __init__(
+        self,
+        url: str,
+        *,
+        name: str | None = None,
+        worker: str | None = None,
+    ) -> None:
+        self.url = make_url(url)
+        self.name = name or f"{self.url.database}_test"
+        self.worker = worker or os.environ.get("PYTEST_XDIST_WORKER", "main")
+
+    @property
+    def template_name(self) -> str:
+        return f"{self.name}_template"
+
+    @property
+    def worker_name(self) -> str:
+        return f"{self.name}_{self.worker}"
+
+    def _sync_url(self, database: str) -> URL:
+        return self.url.set(drivername="postgresql+psycopg2", database=database)
+
+    def _migrations_checksum(self) -> str:
+        checksum = hashlib.sha1()
+        for path in sorted(MIGRATIONS_DIR.glob("versions/*.py")):
+            checksum.update(path.name.encode())
+            checksum.update(path.read_bytes())
+        return checksum.hexdigest()
+
+    def _migrate(self, database: str) -> None:
+        config = Config(str(BASE_DIR / "alembic.ini"))
+        config.set_main_option("script_location", str(MIGRATIONS_DIR))
+        engine = create_engine(self._sync_url(database), poolclass=NullPool)
+        try:
+            with engine.begin() as connection:
+                config.attributes["connection"] = connection
+                command.upgrade(config, "head")
+        finally:
+            engine.dispose()
+
+    def _ensure_template(self, connection) -> None:
+        checksum = self._migrations_checksum()
+        row = connection.execute(
+            text(
+                "SELECT shobj_description(oid, 'pg_database') "
+                "FROM pg_database WHERE datname = :name"
+            ),
+            {"name": self.template_name},
+        ).first()
+        if row is not None and row[0] == checksum:
+            return
+        if row is not None:
+            connection.execute(text(f'DROP DATABASE "{self.template_name}"'))
+        connection.execute(text(f'CREATE DATABASE "{self.template_name}"'))
+        self._migrate(self.template_name)
+        connection.execute(
+            text(f"COMMENT ON DATABASE \"{self.template_name}\" IS '{checksum}'")
+        )
+
+    def create(self) -> str:
+        """
+        Возвращает ссылку на БД воркера с примененными миграциями
+        """
+        engine = create_engine(
+            self._sync_url("postgres"),
+            isolation_level="AUTOCOMMIT",
+            poolclass=NullPool,
+        )
+        try:
+            with engine.connect() as connection:
+                connection.execute(
+                    text("SELECT pg_advisory_lock(:key)"), {"key": TEMPLATE_LOCK_KEY}
+                )
+                try:
+                    self._ensure_template(connection)
+                    connection.execute(
+                        text(f'DROP DATABASE IF EXISTS "{self.worker_name}"')
+                    )
+                    connection.execute(
+                        text(
+                            f'CREATE DATABASE "{self.worker_name}" '
+                            f'TEMPLATE "{self.template_name}"'
+                        )
+                    )
+                finally:
+                    connection.execute(
+                        text("SELECT pg_advisory_unlock(:key)"),
+                        {"key": TEMPLATE_LOCK_KEY},
+                    )
+        finally:
+            engine.dispose()
+        return self.url.set(database=self.worker_name).render_as_string(
+            hide_password=False
+        )
+
+    def drop(self) -> None:
+        engine = create_engine(
+            self._sync_url("postgres"),
+            isolation_level="AUTOCOMMIT",
+            poolclass=NullPool,
+        )
+        try:
+            with engine.connect() as connection:
+                connection.execute(
+                    text(f'DROP DATABASE IF EXISTS "{self.worker_name}" WITH (FORCE)')
+                )
+        finally:
+            engine.dispose()